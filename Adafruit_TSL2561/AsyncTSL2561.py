@@ -0,0 +1,117 @@
+# Copyright (c) 2015 Massimo Gaggero
+# Author: Massimo Gaggero
+import asyncio
+
+from . import TSL2561 as _TSL2561
+
+
+class AsyncTSL2561(object):
+    """asyncio front end of TSL2561.
+
+    Blocking I2C transactions run in an executor, so the event loop is
+    never blocked.  One-shot reads run their whole power on, integrate,
+    read and power off sequence there, under the bus lock of the sensor,
+    so they never interleave with other users of the sensor and a
+    cancelled read still completes and powers the sensor off.  In
+    continuous mode cycle waits use asyncio.sleep.  Register handling and
+    lux conversion are those of the wrapped TSL2561 instance, which is
+    built from the constructor arguments unless passed as sensor.
+    """
+
+    def __init__(self, address=_TSL2561.TSL2561_FLOAT_I2CADDR, package=_TSL2561.TSL2561_PACKAGE_T, i2c=None, sensor=None, executor=None, **kwargs):
+        if sensor is None:
+            sensor = _TSL2561.TSL2561(address, package, i2c, **kwargs)
+        self._sensor = sensor
+        self._executor = executor
+        # Serializes bus sequences issued by concurrent coroutines.
+        self._lock = asyncio.Lock()
+
+    @property
+    def sensor(self):
+        return self._sensor
+
+    async def __aenter__(self):
+        await self.start()
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.stop()
+
+    async def _run(self, func, *args):
+        return await asyncio.get_running_loop().run_in_executor(self._executor, func, *args)
+
+    async def _sleep(self, seconds):
+        # Simulated time is advanced at once; the loop still gets a turn.
+        clock = self._sensor._clock
+        if getattr(clock, 'advances_instantly', False):
+            clock.sleep(seconds)
+            await asyncio.sleep(0)
+        else:
+            await asyncio.sleep(seconds)
+
+    async def _wait_for_cycle(self, cycle):
+        completed, remaining = self._sensor._next_cycle(cycle)
+        if remaining > 0:
+            await self._sleep(remaining)
+        return completed
+
+    def _read_cycle(self):
+        sensor = self._sensor
+        with sensor._bus_lock:
+            broadband, ir = sensor._read_counts()
+            config = sensor._gain | sensor._integration_time
+        sensor._feed_sinks(broadband, ir, config)
+        return broadband, ir
+
+    async def start(self):
+        """Starts continuous acquisition, see TSL2561.start()."""
+        async with self._lock:
+            await self._run(self._sensor.start)
+
+    async def stop(self):
+        """Stops continuous acquisition, see TSL2561.stop()."""
+        async with self._lock:
+            await self._run(self._sensor.stop)
+
+    async def configure(self, gain=None, integration_time=None):
+        async with self._lock:
+            await self._run(self._sensor.configure, gain, integration_time)
+
+    async def set_integration_time(self, itime):
+        await self.configure(integration_time=itime)
+
+    async def set_gain(self, gain):
+        await self.configure(gain=gain)
+
+    async def read_raw_luminosity(self):
+        """Reads the raw luminosity from the sensor.  If cancelled while
+        integrating, the sequence still completes in the executor and powers
+        the sensor off."""
+        sensor = self._sensor
+        async with self._lock:
+            if sensor._continuous:
+                sensor._last_cycle = await self._wait_for_cycle(1)
+                return await self._run(self._read_cycle)
+
+            return await self._run(sensor.read_raw_luminosity)
+
+    async def read_lux(self):
+        """Reads the sensor and returns the illuminance in lux."""
+        ch0, ch1 = await self.read_raw_luminosity()
+        return self._sensor.calculate_lux(ch0, ch1)
+
+    async def stream(self):
+        """Asynchronously yields one (broadband, ir) sample per completed
+        integration cycle, like TSL2561.stream()."""
+        sensor = self._sensor
+        started = not sensor._continuous
+        await self.start()
+        try:
+            while True:
+                async with self._lock:
+                    sensor._last_cycle = await self._wait_for_cycle(sensor._last_cycle + 1)
+                    sample = await self._run(self._read_cycle)
+                yield sample
+        finally:
+            if started:
+                await self.stop()
@@ -0,0 +1,79 @@
+# Copyright (c) 2015 Massimo Gaggero
+# Author: Massimo Gaggero
+"""Time sources of the driver.
+
+A clock provides monotonic() for measuring intervals, time() for sample
+timestamps, sleep() for integration waits and wait(event, timeout) for
+waits that another thread can cut short.  advances_instantly tells whether
+sleeping only moves the clock forward, without passing real time, so that
+asynchronous code must not wait on an event loop for it.  TSL2561 and the
+modules built on it take one as their clock argument; SYSTEM_CLOCK is the
+default.
+"""
+import threading
+import time
+
+
+# Python 2 has no monotonic clock; fall back to wall time there.
+_monotonic = getattr(time, 'monotonic', time.time)
+
+
+class SystemClock(object):
+    """Real time."""
+
+    advances_instantly = False
+
+    def monotonic(self):
+        return _monotonic()
+
+    def time(self):
+        return time.time()
+
+    def sleep(self, seconds):
+        time.sleep(seconds)
+
+    def wait(self, event, timeout):
+        """Waits for a threading.Event for at most timeout seconds and returns
+        whether it is set."""
+        return event.wait(timeout)
+
+
+SYSTEM_CLOCK = SystemClock()
+
+
+class VirtualClock(object):
+    """Simulated time that only moves forward when slept on.
+
+    sleep() and wait() return at once after advancing the clock, so code
+    waiting for integrations runs as fast as the CPU allows while seeing
+    the same timings as in real time.  A SimulatedTSL2561 sharing the clock
+    integrates in step.  monotonic() starts at start and time() at epoch,
+    the current wall clock time by default.  Meant for a single thread
+    driving the simulation: sleeps of several threads add up.
+    """
+
+    advances_instantly = True
+
+    def __init__(self, start=0.0, epoch=None):
+        self._lock = threading.Lock()
+        self._now = float(start)
+        self._offset = (time.time() if epoch is None else epoch) - self._now
+
+    def monotonic(self):
+        return self._now
+
+    def time(self):
+        return self._now + self._offset
+
+    def advance(self, seconds):
+        if seconds > 0:
+            with self._lock:
+                self._now += seconds
+
+    def sleep(self, seconds):
+        self.advance(seconds)
+
+    def wait(self, event, timeout):
+        if not event.is_set() and timeout is not None:
+            self.advance(timeout)
+        return event.is_set()
@@ -0,0 +1,224 @@
+# Copyright (c) 2015 Massimo Gaggero
+# Author: Massimo Gaggero
+"""Offline conversion of raw TSL2561 logs to lux.
+
+Input records hold broadband and ir counts, the Timing Register value
+(gain | integration time) and the package they were read with:
+
+* csv: one record per line, "broadband,ir,gain,integration_time,package"
+  with the TSL2561_* codes; lines that do not start with a digit are
+  skipped.
+* binary: packed little endian records of broadband (uint16), ir (uint16),
+  config (uint8) and package (uint8).
+* log: SampleLog files, the package coming from the header.
+
+Output is one lux value per record, as text lines or little endian uint32.
+Lux is computed by TSL2561.compute_lux(), or compute_lux_array() when NumPy
+is available, in bounded size chunks optionally spread over processes.
+"""
+from __future__ import print_function
+
+import argparse
+import collections
+import multiprocessing
+import struct
+import sys
+import time
+
+from . import SampleLog as _SampleLog
+from . import TSL2561 as _TSL2561
+
+
+BINARY_RECORD = struct.Struct('<HHBB')
+_LUX_RECORD = struct.Struct('<I')
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+def convert_records(broadband, ir, config, package):
+    """Converts parallel sequences of record fields to a list of lux values,
+    or to an array when NumPy is available."""
+    if np is None:
+        return [_TSL2561.compute_lux(b, i, c & 0x03, c & _TSL2561.TSL2561_GAIN_16x, p)
+                for b, i, c, p in zip(broadband, ir, config, package)]
+
+    broadband = np.asarray(broadband)
+    ir = np.asarray(ir)
+    keys = (np.asarray(config, dtype=np.int64) << 8) | np.asarray(package, dtype=np.int64)
+    lux = np.empty(len(keys), dtype=np.int64)
+    # Few distinct settings appear in a log; convert each group at once.
+    for key in np.unique(keys):
+        selected = keys == key
+        config, package = int(key) >> 8, int(key) & 0xFF
+        lux[selected] = _TSL2561.compute_lux_array(broadband[selected], ir[selected], config & 0x03, config & _TSL2561.TSL2561_GAIN_16x, package)
+    return lux
+
+
+def _parse_csv(lines):
+    broadband, ir, config, package = [], [], [], []
+    for line in lines:
+        if not line[:1].isdigit():
+            continue
+        fields = line.split(',')
+        broadband.append(int(fields[0]))
+        ir.append(int(fields[1]))
+        config.append(int(fields[2]) | int(fields[3]))
+        package.append(int(fields[4]))
+    return broadband, ir, config, package
+
+
+def _parse_binary(data):
+    # A truncated trailing record is ignored.
+    data = data[:len(data) - len(data) % BINARY_RECORD.size]
+    if np is not None:
+        records = np.frombuffer(data, dtype=[('broadband', '<u2'), ('ir', '<u2'), ('config', 'u1'), ('package', 'u1')])
+        return records['broadband'], records['ir'], records['config'], records['package']
+    broadband, ir, config, package = [], [], [], []
+    for offset in range(0, len(data), BINARY_RECORD.size):
+        b, i, c, p = BINARY_RECORD.unpack_from(data, offset)
+        broadband.append(b)
+        ir.append(i)
+        config.append(c)
+        package.append(p)
+    return broadband, ir, config, package
+
+
+def _parse_log(data, package):
+    data = data[:len(data) - len(data) % _SampleLog.RECORD.size]
+    if np is not None:
+        records = np.frombuffer(data, dtype=np.dtype(_SampleLog.RECORD_DTYPE))
+        return records['broadband'], records['ir'], records['config'], np.full(len(records), package, dtype=np.int64)
+    broadband, ir, config = [], [], []
+    for offset in range(0, len(data), _SampleLog.RECORD.size):
+        timestamp, b, i, c, sensor_id = _SampleLog.RECORD.unpack_from(data, offset)
+        broadband.append(b)
+        ir.append(i)
+        config.append(c)
+    return broadband, ir, config, [package] * len(broadband)
+
+
+def _format_lux(lux, output_format):
+    if output_format == 'binary':
+        if np is not None:
+            return np.asarray(lux, dtype='<u4').tobytes()
+        return b''.join(_LUX_RECORD.pack(value) for value in lux)
+    return ''.join('{0:d}\n'.format(int(value)) for value in lux).encode('ascii')
+
+
+def convert_chunk(chunk):
+    """Converts one (input_format, output_format, payload, package) chunk and
+    returns the encoded output and the number of records.  package is only
+    used by log chunks."""
+    input_format, output_format, payload, package = chunk
+    if input_format == 'csv':
+        fields = _parse_csv(payload.decode('ascii').splitlines())
+    elif input_format == 'log':
+        fields = _parse_log(payload, package)
+    else:
+        fields = _parse_binary(payload)
+    lux = convert_records(*fields)
+    return _format_lux(lux, output_format), len(lux)
+
+
+def read_chunks(stream, input_format, chunk_size):
+    """Yields payloads of about chunk_size records, split on record
+    boundaries.  Log streams must be positioned after the header."""
+    if input_format == 'csv':
+        while True:
+            lines = stream.readlines(chunk_size * 32)
+            if not lines:
+                return
+            yield b''.join(lines)
+    else:
+        record_size = _SampleLog.RECORD.size if input_format == 'log' else BINARY_RECORD.size
+        size = chunk_size * record_size
+        while True:
+            data = stream.read(size)
+            if not data:
+                return
+            yield data
+
+
+def convert(input_stream, output_stream, input_format='csv', output_format='csv', chunk_size=65536, jobs=1):
+    """Converts a whole stream and returns (records, bytes read)."""
+    records = 0
+    nbytes = 0
+    package = None
+    if input_format == 'log':
+        header = input_stream.read(_SampleLog.HEADER.size)
+        nbytes += len(header)
+        version, package = _SampleLog.read_header(header)
+    chunks = ((input_format, output_format, payload, package) for payload in read_chunks(input_stream, input_format, chunk_size))
+
+    if jobs <= 1:
+        for chunk in chunks:
+            nbytes += len(chunk[2])
+            output, count = convert_chunk(chunk)
+            output_stream.write(output)
+            records += count
+        return records, nbytes
+
+    # Keep a bounded number of chunks in flight, written back in order.
+    pool = multiprocessing.Pool(jobs)
+    pending = collections.deque()
+    try:
+        for chunk in chunks:
+            nbytes += len(chunk[2])
+            pending.append(pool.apply_async(convert_chunk, (chunk,)))
+            if len(pending) >= 2 * jobs:
+                output, count = pending.popleft().get()
+                output_stream.write(output)
+                records += count
+        while pending:
+            output, count = pending.popleft().get()
+            output_stream.write(output)
+            records += count
+    finally:
+        pool.terminate()
+    return records, nbytes
+
+
+def _binary_stream(stream):
+    # On Python 3 the standard streams are text; use their byte buffers.
+    return getattr(stream, 'buffer', stream)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Convert raw TSL2561 logs to lux.')
+    parser.add_argument('input', help='raw log file, - for standard input')
+    parser.add_argument('-o', '--output', default='-', help='lux output file, - for standard output (default)')
+    parser.add_argument('-f', '--format', choices=('csv', 'binary', 'log'), help='input format (default: log for files starting with a sample log header, csv for .csv files and standard input, binary otherwise)')
+    parser.add_argument('-F', '--output-format', choices=('csv', 'binary'), default='csv', help='output format (default: csv)')
+    parser.add_argument('-c', '--chunk-size', type=int, default=65536, help='records per chunk (default: 65536)')
+    parser.add_argument('-j', '--jobs', type=int, default=1, help='worker processes (default: 1)')
+    args = parser.parse_args(argv)
+
+    input_stream = _binary_stream(sys.stdin) if args.input == '-' else open(args.input, 'rb')
+
+    input_format = args.format
+    if input_format is None:
+        if args.input == '-' or args.input.lower().endswith('.csv'):
+            input_format = 'csv'
+        else:
+            input_format = 'log' if input_stream.read(len(_SampleLog.MAGIC)) == _SampleLog.MAGIC else 'binary'
+            input_stream.seek(0)
+    output_stream = _binary_stream(sys.stdout) if args.output == '-' else open(args.output, 'wb')
+    start = time.time()
+    try:
+        records, nbytes = convert(input_stream, output_stream, input_format, args.output_format, args.chunk_size, args.jobs)
+    finally:
+        if args.input != '-':
+            input_stream.close()
+        if args.output != '-':
+            output_stream.close()
+    elapsed = max(time.time() - start, 1e-9)
+    print('{0:d} records, {1:0.1f} MB in {2:0.2f} s: {3:0.0f} records/s, {4:0.1f} MB/s'.format(
+        records, nbytes / 1e6, elapsed, records / elapsed, nbytes / 1e6 / elapsed), file=sys.stderr)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,430 @@
+# Copyright (c) 2015 Massimo Gaggero
+# Author: Massimo Gaggero
+"""Sensor daemon serving TSL2561 readings to local clients.
+
+The daemon owns the sensors, samples each one on a BackgroundSampler and
+serves the newest sample over a Unix domain socket, so that any number of
+processes share one acquisition per sensor.
+
+Clients send REQUEST frames of an opcode and a sensor address:
+
+* OP_READ: answered with one SAMPLE frame holding the newest sample, or the
+  first one if the sensor has not completed an integration yet.
+* OP_SUBSCRIBE: a SAMPLE frame is pushed for every new sample of the sensor
+  until OP_UNSUBSCRIBE.
+
+SAMPLE frames echo the opcode they answer (OP_SUBSCRIBE for pushes) and hold
+a status, the sensor address, the Timing Register value (gain | integration
+time), the package, the raw counts and the wall clock time of the sample.
+Pushes to a client not keeping up are dropped once max_buffer bytes are
+waiting to be sent to it.
+"""
+import argparse
+import collections
+import errno
+import logging
+import os
+import selectors
+import signal
+import socket
+import stat
+import struct
+import sys
+import threading
+
+from . import Sampler as _Sampler
+from . import TSL2561 as _TSL2561
+
+
+DEFAULT_PATH = '/var/run/tsl2561.sock'
+
+OP_READ        = 0x01
+OP_SUBSCRIBE   = 0x02
+OP_UNSUBSCRIBE = 0x03
+
+STATUS_OK        = 0x00
+STATUS_NO_SENSOR = 0x01
+
+# Request: opcode, sensor address.
+REQUEST = struct.Struct('<BB')
+
+# Sample: opcode, status, sensor address, config, package, broadband, ir,
+# timestamp.
+SAMPLE = struct.Struct('<BBBBBHHd')
+
+
+class _Connection(object):
+
+    def __init__(self, sock):
+        self.sock = sock
+        self.inbox = bytearray()
+        self.outbox = bytearray()
+        self.subscriptions = set()
+        self.closed = False
+
+
+class _Sink(object):
+    """Sensor sink handing every sample to the daemon loop."""
+
+    def __init__(self, daemon, address, package):
+        self._daemon = daemon
+        self._address = address
+        self._package = package
+
+    def append(self, timestamp, broadband, ir, config):
+        self._daemon._post(self._address, (STATUS_OK, self._address, config, self._package, broadband, ir, timestamp))
+
+
+class SensorDaemon(object):
+    """Serves the readings of sensors, TSL2561 instances with distinct
+    addresses, on the Unix domain socket at path.
+
+    Each sensor is sampled by a Sampler.BackgroundSampler with the given
+    interval, None meaning continuous mode.  serve_forever() runs the socket
+    loop in the calling thread until shutdown() is called from another one.
+    """
+
+    def __init__(self, path, sensors, interval=None, mode=0o660, max_buffer=65536):
+        self._logger = logging.getLogger('Adafruit_TSL2561.Daemon')
+        self._path = path
+        self._mode = mode
+        self._max_buffer = max_buffer
+        self._sensors = collections.OrderedDict((sensor._address, sensor) for sensor in sensors)
+        self._samplers = [_Sampler.BackgroundSampler(sensor, interval) for sensor in self._sensors.values()]
+        self._sinks = {}
+
+        # Newest reply frame of each sensor, and the connections waiting for
+        # the first one.
+        self._latest = {}
+        self._waiting = dict((address, []) for address in self._sensors)
+        self._subscribers = dict((address, set()) for address in self._sensors)
+
+        # Samples posted by the sampler threads and not yet dispatched.  The
+        # loop is woken up through the socket pair once per batch.
+        self._lock = threading.Lock()
+        self._posted = {}
+        self._woken = False
+        self._wakeup_recv, self._wakeup_send = socket.socketpair()
+        self._wakeup_recv.setblocking(False)
+
+        self._selector = None
+        self._listener = None
+        self._stopping = False
+
+        self.requests = 0
+        self.pushes = 0
+        self.dropped = 0
+
+    @property
+    def path(self):
+        return self._path
+
+    @property
+    def clients(self):
+        if self._selector is None:
+            return 0
+        return len(self._selector.get_map()) - 2
+
+    def _post(self, address, fields):
+        with self._lock:
+            self._posted[address] = fields
+            wake = not self._woken
+            self._woken = True
+        if wake:
+            self._wakeup_send.send(b'\0')
+
+    def _bind(self):
+        # A socket left behind by a daemon that was killed is replaced;
+        # anything else at path is not.
+        try:
+            if stat.S_ISSOCK(os.stat(self._path).st_mode):
+                os.unlink(self._path)
+        except OSError as error:
+            if error.errno != errno.ENOENT:
+                raise
+        listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        listener.bind(self._path)
+        os.chmod(self._path, self._mode)
+        listener.listen(128)
+        listener.setblocking(False)
+        return listener
+
+    def serve_forever(self):
+        """Starts sampling and serves clients until shutdown()."""
+        self._listener = self._bind()
+        self._selector = selectors.DefaultSelector()
+        self._selector.register(self._listener, selectors.EVENT_READ, 'listener')
+        self._selector.register(self._wakeup_recv, selectors.EVENT_READ, 'wakeup')
+        for address, sensor in self._sensors.items():
+            self._sinks[address] = _Sink(self, address, sensor._package)
+            sensor.add_sink(self._sinks[address])
+        for sampler in self._samplers:
+            sampler.start()
+        self._logger.info('Serving {0} sensors on {1}'.format(len(self._sensors), self._path))
+        try:
+            while not self._stopping:
+                for key, events in self._selector.select():
+                    if key.data == 'listener':
+                        self._accept()
+                    elif key.data == 'wakeup':
+                        self._dispatch()
+                    else:
+                        # Skip connections closed earlier in this batch.
+                        if events & selectors.EVENT_WRITE and not key.data.closed:
+                            self._flush(key.data)
+                        if events & selectors.EVENT_READ and not key.data.closed:
+                            self._receive(key.data)
+        finally:
+            self._close()
+
+    def shutdown(self):
+        """Makes serve_forever() return.  Safe to call from any thread or a
+        signal handler."""
+        self._stopping = True
+        self._wakeup_send.send(b'\0')
+
+    def _close(self):
+        for sampler in self._samplers:
+            sampler.stop()
+        for address, sink in self._sinks.items():
+            self._sensors[address].remove_sink(sink)
+        self._sinks.clear()
+        for key in list(self._selector.get_map().values()):
+            if isinstance(key.data, _Connection):
+                self._disconnect(key.data)
+        self._selector.close()
+        self._selector = None
+        self._listener.close()
+        self._listener = None
+        try:
+            os.unlink(self._path)
+        except OSError:
+            pass
+
+    def _accept(self):
+        while True:
+            try:
+                sock, address = self._listener.accept()
+            except (BlockingIOError, InterruptedError):
+                return
+            sock.setblocking(False)
+            self._selector.register(sock, selectors.EVENT_READ, _Connection(sock))
+
+    def _disconnect(self, connection):
+        connection.closed = True
+        for address in connection.subscriptions:
+            self._subscribers[address].discard(connection)
+        for waiting in self._waiting.values():
+            if connection in waiting:
+                waiting.remove(connection)
+        self._selector.unregister(connection.sock)
+        connection.sock.close()
+
+    def _receive(self, connection):
+        try:
+            data = connection.sock.recv(4096)
+        except (BlockingIOError, InterruptedError):
+            return
+        except OSError:
+            data = b''
+        if not data:
+            self._disconnect(connection)
+            return
+        connection.inbox += data
+        count = len(connection.inbox) // REQUEST.size
+        for offset in range(0, count * REQUEST.size, REQUEST.size):
+            opcode, address = REQUEST.unpack_from(connection.inbox, offset)
+            if not self._request(connection, opcode, address):
+                self._disconnect(connection)
+                return
+        del connection.inbox[:count * REQUEST.size]
+
+    def _request(self, connection, opcode, address):
+        """Handles one request; returns False for a malformed one."""
+        self.requests += 1
+        if opcode not in (OP_READ, OP_SUBSCRIBE, OP_UNSUBSCRIBE):
+            self._logger.warning('Unexpected opcode 0x{0:02X}, closing connection'.format(opcode))
+            return False
+        if address not in self._sensors:
+            self._send(connection, SAMPLE.pack(opcode, STATUS_NO_SENSOR, address, 0, 0, 0, 0, 0.0), False)
+        elif opcode == OP_READ:
+            frame = self._latest.get(address)
+            if frame is None:
+                self._waiting[address].append(connection)
+            else:
+                self._send(connection, frame, False)
+        elif opcode == OP_SUBSCRIBE:
+            connection.subscriptions.add(address)
+            self._subscribers[address].add(connection)
+        else:
+            connection.subscriptions.discard(address)
+            self._subscribers[address].discard(connection)
+        return True
+
+    def _dispatch(self):
+        try:
+            while self._wakeup_recv.recv(4096):
+                pass
+        except (BlockingIOError, InterruptedError):
+            pass
+        with self._lock:
+            posted = self._posted
+            self._posted = {}
+            self._woken = False
+        for address, fields in posted.items():
+            reply = SAMPLE.pack(OP_READ, *fields)
+            self._latest[address] = reply
+            waiting = self._waiting[address]
+            while waiting:
+                self._send(waiting.pop(), reply, False)
+            if self._subscribers[address]:
+                push = SAMPLE.pack(OP_SUBSCRIBE, *fields)
+                for connection in list(self._subscribers[address]):
+                    self._send(connection, push, True)
+
+    def _send(self, connection, frame, push):
+        if connection.closed:
+            return
+        if connection.outbox:
+            if push and len(connection.outbox) >= self._max_buffer:
+                self.dropped += 1
+                return
+            connection.outbox += frame
+        else:
+            connection.outbox += frame
+            self._flush(connection)
+        if push:
+            self.pushes += 1
+
+    def _flush(self, connection):
+        try:
+            sent = connection.sock.send(connection.outbox)
+        except (BlockingIOError, InterruptedError):
+            sent = 0
+        except OSError:
+            self._disconnect(connection)
+            return
+        del connection.outbox[:sent]
+        events = selectors.EVENT_READ | selectors.EVENT_WRITE if connection.outbox else selectors.EVENT_READ
+        if self._selector.get_key(connection.sock).events != events:
+            self._selector.modify(connection.sock, events, connection)
+
+
+class TSL2561Client(object):
+    """Reads a sensor served by a SensorDaemon with the read API of
+    TSL2561.  Readings come from the daemon's newest sample, so reads do not
+    wait for an integration of their own."""
+
+    def __init__(self, address=_TSL2561.TSL2561_FLOAT_I2CADDR, path=DEFAULT_PATH):
+        self._address = address
+        self._sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._sock.connect(path)
+        # Pushed samples received while waiting for a reply.
+        self._pushed = collections.deque()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        if self._sock is None:
+            return
+        self._sock.close()
+        self._sock = None
+
+    def _receive(self):
+        frame = bytearray()
+        while len(frame) < SAMPLE.size:
+            data = self._sock.recv(SAMPLE.size - len(frame))
+            if not data:
+                raise IOError('Connection closed by the sensor daemon')
+            frame += data
+        opcode, status, address, config, package, broadband, ir, timestamp = SAMPLE.unpack(bytes(frame))
+        if status == STATUS_NO_SENSOR:
+            raise IOError('No sensor at address 0x{0:02X}'.format(address))
+        return opcode, _TSL2561.TSL2561Reading(broadband, ir, config & _TSL2561.TSL2561_GAIN_16x, config & 0x03, package, timestamp)
+
+    def read(self):
+        """Returns the newest TSL2561Reading of the sensor."""
+        self._sock.sendall(REQUEST.pack(OP_READ, self._address))
+        while True:
+            opcode, reading = self._receive()
+            if opcode == OP_READ:
+                return reading
+            self._pushed.append(reading)
+
+    def read_raw_luminosity(self):
+        reading = self.read()
+        return reading.broadband, reading.ir
+
+    def read_lux(self):
+        return self.read().lux
+
+    def stream(self):
+        """Yields one (broadband, ir) sample per sample taken by the daemon,
+        like TSL2561.stream(), until the generator is closed."""
+        for reading in self.readings():
+            yield reading.broadband, reading.ir
+
+    def readings(self):
+        """Yields a TSL2561Reading per sample taken by the daemon until the
+        generator is closed."""
+        self._sock.sendall(REQUEST.pack(OP_SUBSCRIBE, self._address))
+        try:
+            while True:
+                while self._pushed:
+                    yield self._pushed.popleft()
+                opcode, reading = self._receive()
+                if opcode == OP_SUBSCRIBE:
+                    yield reading
+        finally:
+            if self._sock is not None:
+                self._sock.sendall(REQUEST.pack(OP_UNSUBSCRIBE, self._address))
+                self._pushed.clear()
+
+
+_INTEGRATION_TIMES = {
+    '13': _TSL2561.TSL2561_INTEGRATIONTIME_13MS,
+    '101': _TSL2561.TSL2561_INTEGRATIONTIME_101MS,
+    '402': _TSL2561.TSL2561_INTEGRATIONTIME_402MS,
+}
+
+_GAINS = {
+    '1': _TSL2561.TSL2561_GAIN_1x,
+    '16': _TSL2561.TSL2561_GAIN_16x,
+}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Serve TSL2561 readings over a Unix domain socket.')
+    parser.add_argument('-s', '--socket', default=DEFAULT_PATH, help='socket path (default: {0})'.format(DEFAULT_PATH))
+    parser.add_argument('-b', '--busnum', type=int, help='I2C bus number (default: the platform default)')
+    parser.add_argument('-a', '--address', action='append', type=lambda value: int(value, 0), help='sensor address, may be repeated (default: 0x39)')
+    parser.add_argument('-g', '--gain', choices=sorted(_GAINS), default='1', help='gain (default: 1)')
+    parser.add_argument('-i', '--integration-time', choices=sorted(_INTEGRATION_TIMES), default='402', help='integration time in ms (default: 402)')
+    parser.add_argument('-n', '--interval', type=float, help='seconds between samples (default: continuous)')
+    parser.add_argument('-v', '--verbose', action='store_true', help='log requests statistics')
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.WARNING)
+    kwargs = {} if args.busnum is None else {'busnum': args.busnum}
+    sensors = []
+    for address in args.address or [_TSL2561.TSL2561_FLOAT_I2CADDR]:
+        sensor = _TSL2561.TSL2561(address, **kwargs)
+        sensor.configure(gain=_GAINS[args.gain], integration_time=_INTEGRATION_TIMES[args.integration_time])
+        sensors.append(sensor)
+
+    daemon = SensorDaemon(args.socket, sensors, args.interval)
+    signal.signal(signal.SIGTERM, lambda signum, frame: daemon.shutdown())
+    try:
+        daemon.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    logging.getLogger('Adafruit_TSL2561.Daemon').info('{0} requests, {1} pushes, {2} dropped'.format(daemon.requests, daemon.pushes, daemon.dropped))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,122 @@
+# Copyright (c) 2015 Massimo Gaggero
+# Author: Massimo Gaggero
+"""Generator stages for streams of (broadband, ir) raw counts.
+
+Each function returns a stage: a callable taking an iterable of samples and
+returning a generator of filtered samples.  Stages are chained with
+pipeline(), converting to lux last so that filtering runs on raw counts:
+
+    readings = pipeline(sensor.stream(), median(5), ema(0.2), deadband(10),
+                        to_lux(sensor))
+"""
+from bisect import bisect_left, insort
+from collections import deque
+
+
+def pipeline(source, *stages):
+    """Chains stages over source and returns the resulting generator."""
+    for stage in stages:
+        source = stage(source)
+    return source
+
+
+def median(n):
+    """Sliding median of the last n samples of each channel, removing spikes
+    shorter than n / 2 samples."""
+    if n <= 0:
+        raise ValueError('Unexpected window {0}. Set to a positive number of samples'.format(n))
+    def stage(source):
+        window = deque()
+        sorted0 = []
+        sorted1 = []
+        middle = 0
+        for sample in source:
+            broadband, ir = sample
+            window.append(sample)
+            insort(sorted0, broadband)
+            insort(sorted1, ir)
+            if len(window) > n:
+                old0, old1 = window.popleft()
+                del sorted0[bisect_left(sorted0, old0)]
+                del sorted1[bisect_left(sorted1, old1)]
+            else:
+                middle = len(window) // 2
+            yield sorted0[middle], sorted1[middle]
+    return stage
+
+
+def ema(alpha):
+    """Exponential moving average with smoothing factor alpha in (0, 1]."""
+    if not 0 < alpha <= 1:
+        raise ValueError('Unexpected smoothing factor {0}. Set to a value in (0, 1]'.format(alpha))
+    def stage(source):
+        iterator = iter(source)
+        for broadband, ir in iterator:
+            average0 = float(broadband)
+            average1 = float(ir)
+            yield average0, average1
+            break
+        for broadband, ir in iterator:
+            average0 += alpha * (broadband - average0)
+            average1 += alpha * (ir - average1)
+            yield average0, average1
+    return stage
+
+
+def boxcar(n):
+    """Moving average of the last n samples of each channel."""
+    if n <= 0:
+        raise ValueError('Unexpected window {0}. Set to a positive number of samples'.format(n))
+    def stage(source):
+        window = deque()
+        total0 = 0
+        total1 = 0
+        for sample in source:
+            window.append(sample)
+            total0 += sample[0]
+            total1 += sample[1]
+            if len(window) > n:
+                old0, old1 = window.popleft()
+                total0 -= old0
+                total1 -= old1
+            count = float(len(window))
+            yield total0 / count, total1 / count
+    return stage
+
+
+def downsample(n):
+    """Passes one sample out of every n, starting with the first."""
+    if n <= 0:
+        raise ValueError('Unexpected factor {0}. Set to a positive number of samples'.format(n))
+    def stage(source):
+        skip = 0
+        for sample in source:
+            if skip == 0:
+                yield sample
+                skip = n
+            skip -= 1
+    return stage
+
+
+def deadband(threshold):
+    """Passes a sample only when a channel moved by more than threshold counts
+    from the last sample passed.  The first sample always passes."""
+    def stage(source):
+        last0 = last1 = None
+        for sample in source:
+            broadband, ir = sample
+            if last0 is None or abs(broadband - last0) > threshold or abs(ir - last1) > threshold:
+                last0 = broadband
+                last1 = ir
+                yield sample
+    return stage
+
+
+def to_lux(sensor):
+    """Converts samples to lux with the current settings of sensor.  Filtered
+    counts are rounded first, the conversion being integer arithmetic."""
+    def stage(source):
+        calculate_lux = sensor.calculate_lux
+        for broadband, ir in source:
+            yield calculate_lux(int(round(broadband)), int(round(ir)))
+    return stage
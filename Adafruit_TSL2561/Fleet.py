@@ -0,0 +1,164 @@
+# Copyright (c) 2015 Massimo Gaggero
+# Author: Massimo Gaggero
+import logging
+import multiprocessing
+import time
+
+from . import TSL2561 as _TSL2561
+
+
+# Doubles per ring record: timestamp, sensor index, broadband, ir, config.
+_RECORD_SIZE = 5
+
+
+def default_sensor_factory(busnum, address):
+    """Builds the TSL2561 at address on bus busnum."""
+    return _TSL2561.TSL2561(address, busnum=busnum)
+
+
+class SharedRing(object):
+    """Single writer ring of sample records in shared memory.
+
+    The writer stores a record and then bumps the shared record count, so a
+    reader in another process copies new records straight out of the shared
+    array without any pickling.  Records overwritten before the reader got
+    to them are dropped.  While the count is n the writer may be rewriting
+    the slot of record n - capacity, so only the last capacity - 1 records
+    are read.
+    """
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self._data = multiprocessing.RawArray('d', capacity * _RECORD_SIZE)
+        self._written = multiprocessing.RawValue('Q', 0)
+        self._read = 0
+
+    @property
+    def written(self):
+        return self._written.value
+
+    def append(self, timestamp, index, broadband, ir, config):
+        written = self._written.value
+        offset = (written % self.capacity) * _RECORD_SIZE
+        self._data[offset:offset + _RECORD_SIZE] = [timestamp, index, broadband, ir, config]
+        self._written.value = written + 1
+
+    def read(self):
+        """Returns the records written since the last call as a list of
+        (timestamp, index, broadband, ir, config) tuples, and the number of
+        records lost to overwriting."""
+        written = self._written.value
+        first = max(self._read, written + 1 - self.capacity)
+        records = []
+        for number in range(first, written):
+            offset = (number % self.capacity) * _RECORD_SIZE
+            timestamp, index, broadband, ir, config = self._data[offset:offset + _RECORD_SIZE]
+            records.append((timestamp, int(index), int(broadband), int(ir), int(config)))
+        # The writer may have lapped the copy; drop what it overwrote.
+        overwritten = self._written.value + 1 - self.capacity - first
+        if overwritten > 0:
+            records = records[overwritten:]
+            first += overwritten
+        lost = first - self._read
+        self._read = written
+        return records, lost
+
+
+def _worker(busnum, addresses, factory, ring, heartbeat, stopping):
+    logger = logging.getLogger('Adafruit_TSL2561.Fleet')
+    try:
+        group = _TSL2561.TSL2561Group([factory(busnum, address) for address in addresses])
+        while not stopping.is_set():
+            results = group.read_raw_luminosity()
+            timestamp = time.time()
+            for index, sensor in enumerate(group.sensors):
+                broadband, ir = results[index]
+                ring.append(timestamp, index, broadband, ir, sensor._gain | sensor._integration_time)
+            heartbeat.value = _TSL2561._monotonic()
+    except Exception:
+        logger.exception('Worker for bus {0} failed'.format(busnum))
+        raise
+
+
+class Fleet(object):
+    """Polls TSL2561 sensors spread over several I2C buses with one worker
+    process per bus.
+
+    buses maps each bus number to the addresses of its sensors.  Workers
+    read all sensors of their bus together through TSL2561Group and write
+    samples to a SharedRing per bus.  read() collects new samples and
+    restarts workers that died or stopped reporting for heartbeat_timeout
+    seconds.  factory(busnum, address) builds the sensors inside the worker
+    and must be a module level function.
+    """
+
+    def __init__(self, buses, factory=default_sensor_factory, capacity=4096, heartbeat_timeout=5.0):
+        self._logger = logging.getLogger('Adafruit_TSL2561.Fleet')
+        self._buses = dict((busnum, list(addresses)) for busnum, addresses in buses.items())
+        self._factory = factory
+        self._capacity = capacity
+        self._heartbeat_timeout = heartbeat_timeout
+        self._rings = {}
+        self._heartbeats = {}
+        self._processes = {}
+        self._stopping = multiprocessing.Event()
+        self.restarts = dict((busnum, 0) for busnum in self._buses)
+        self.lost = dict((busnum, 0) for busnum in self._buses)
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def _spawn(self, busnum):
+        self._rings.setdefault(busnum, SharedRing(self._capacity))
+        heartbeat = self._heartbeats.setdefault(busnum, multiprocessing.RawValue('d', 0.0))
+        heartbeat.value = _TSL2561._monotonic()
+        process = multiprocessing.Process(target=_worker, name='TSL2561 bus {0}'.format(busnum),
+                                          args=(busnum, self._buses[busnum], self._factory, self._rings[busnum], heartbeat, self._stopping))
+        process.daemon = True
+        process.start()
+        self._processes[busnum] = process
+
+    def start(self):
+        self._stopping.clear()
+        for busnum in self._buses:
+            if busnum not in self._processes:
+                self._spawn(busnum)
+
+    def stop(self, timeout=5.0):
+        self._stopping.set()
+        for process in self._processes.values():
+            process.join(timeout)
+            if process.is_alive():
+                process.terminate()
+        self._processes.clear()
+
+    def check(self):
+        """Restarts workers that died or missed their heartbeat."""
+        now = _TSL2561._monotonic()
+        for busnum, process in list(self._processes.items()):
+            stalled = now - self._heartbeats[busnum].value > self._heartbeat_timeout
+            if process.is_alive() and not stalled:
+                continue
+            self._logger.warning('Restarting worker for bus {0} ({1})'.format(busnum, 'stalled' if stalled else 'exit code {0}'.format(process.exitcode)))
+            if process.is_alive():
+                process.terminate()
+                process.join()
+            self.restarts[busnum] += 1
+            self._spawn(busnum)
+
+    def read(self):
+        """Returns the samples written since the last call as a list of
+        (busnum, address, timestamp, broadband, ir, config) tuples."""
+        self.check()
+        samples = []
+        for busnum, ring in self._rings.items():
+            addresses = self._buses[busnum]
+            records, lost = ring.read()
+            self.lost[busnum] += lost
+            for timestamp, index, broadband, ir, config in records:
+                samples.append((busnum, addresses[index], timestamp, broadband, ir, config))
+        return samples
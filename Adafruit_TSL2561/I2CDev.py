@@ -0,0 +1,109 @@
+# Copyright (c) 2015 Massimo Gaggero
+# Author: Massimo Gaggero
+import ctypes
+import os
+import struct
+
+from . import TSL2561 as _TSL2561
+
+
+# ioctl requests and message flags from linux/i2c-dev.h and linux/i2c.h.
+I2C_RDWR  = 0x0707
+I2C_M_RD  = 0x0001
+
+DEFAULT_BUSNUM = 1
+
+
+class _I2CMsg(ctypes.Structure):
+    _fields_ = [
+        ('addr', ctypes.c_uint16),
+        ('flags', ctypes.c_uint16),
+        ('len', ctypes.c_uint16),
+        ('buf', ctypes.POINTER(ctypes.c_uint8)),
+    ]
+
+
+class _I2CRdwrIoctlData(ctypes.Structure):
+    _fields_ = [
+        ('msgs', ctypes.POINTER(_I2CMsg)),
+        ('nmsgs', ctypes.c_uint32),
+    ]
+
+
+class I2CDevDevice(object):
+    """TSL2561 access through a Linux /dev/i2c-N character device.
+
+    Every transaction is one I2C_RDWR ioctl, reads being a combined command
+    write and data read.  read_channels() fetches CHAN0_LOW..CHAN1_HIGH in a
+    single 4 byte block read, which TSL2561 uses instead of two word reads.
+    Messages and buffers are allocated once.  opener and ioctl can be replaced
+    to test without hardware.
+    """
+
+    def __init__(self, address, busnum=DEFAULT_BUSNUM, opener=os.open, ioctl=None):
+        if ioctl is None:
+            import fcntl
+            ioctl = fcntl.ioctl
+        self._address = address
+        self._ioctl = ioctl
+        self._fd = opener('/dev/i2c-{0:d}'.format(busnum), os.O_RDWR)
+
+        self._write_buf = (ctypes.c_uint8 * 3)()
+        self._read_buf = (ctypes.c_uint8 * 4)()
+        self._msgs = (_I2CMsg * 2)()
+        self._msgs[0].addr = address
+        self._msgs[0].buf = ctypes.cast(self._write_buf, ctypes.POINTER(ctypes.c_uint8))
+        self._msgs[1].addr = address
+        self._msgs[1].flags = I2C_M_RD
+        self._msgs[1].buf = ctypes.cast(self._read_buf, ctypes.POINTER(ctypes.c_uint8))
+        self._data = _I2CRdwrIoctlData(ctypes.cast(self._msgs, ctypes.POINTER(_I2CMsg)), 0)
+
+    def close(self):
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+
+    def _transfer(self, write_len, read_len=0):
+        self._msgs[0].len = write_len
+        self._msgs[1].len = read_len
+        self._data.nmsgs = 2 if read_len else 1
+        self._ioctl(self._fd, I2C_RDWR, self._data)
+
+    def write8(self, register, value):
+        self._write_buf[0] = register
+        self._write_buf[1] = value & 0xFF
+        self._transfer(2)
+
+    def write16(self, register, value):
+        self._write_buf[0] = register
+        self._write_buf[1] = value & 0xFF
+        self._write_buf[2] = (value >> 8) & 0xFF
+        self._transfer(3)
+
+    def writeRaw8(self, value):
+        self._write_buf[0] = value & 0xFF
+        self._transfer(1)
+
+    def readU8(self, register):
+        self._write_buf[0] = register
+        self._transfer(1, 1)
+        return self._read_buf[0]
+
+    def readU16LE(self, register):
+        self._write_buf[0] = register
+        self._transfer(1, 2)
+        return struct.unpack_from('<H', self._read_buf)[0]
+
+    def read_channels(self):
+        """Returns (broadband, ir) read in one block transaction."""
+        self._write_buf[0] = _TSL2561.TSL2561_COMMAND_BIT | _TSL2561.TSL2561_BLOCK_BIT | _TSL2561.TSL2561_REGISTER_CHAN0_LOW
+        self._transfer(1, 4)
+        return struct.unpack_from('<HH', self._read_buf)
+
+
+def get_i2c_device(address, busnum=None, **kwargs):
+    """Returns an I2CDevDevice, so that this module can be passed as the i2c
+    argument of TSL2561 like Adafruit_GPIO.I2C."""
+    if busnum is None:
+        busnum = DEFAULT_BUSNUM
+    return I2CDevDevice(address, busnum, **kwargs)
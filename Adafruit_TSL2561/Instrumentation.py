@@ -0,0 +1,171 @@
+# Copyright (c) 2015 Massimo Gaggero
+# Author: Massimo Gaggero
+from bisect import bisect_left
+
+from . import TSL2561 as _TSL2561
+
+
+# Upper bounds (s) of the histogram buckets: powers of two from about 1 us to
+# about 4 s.  Longer values go to a final overflow bucket.
+HISTOGRAM_BOUNDS = tuple(2.0 ** exponent for exponent in range(-20, 3))
+
+
+class Histogram(object):
+    """Latency histogram with power of two buckets."""
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.buckets = [0] * (len(HISTOGRAM_BOUNDS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.min = None
+        self.max = None
+
+    def record(self, value):
+        self.buckets[bisect_left(HISTOGRAM_BOUNDS, value)] += 1
+        self.count += 1
+        self.total += value
+        if self.min is None or value < self.min:
+            self.min = value
+        if self.max is None or value > self.max:
+            self.max = value
+
+    def percentile(self, percent):
+        """Returns the upper bound of the bucket holding the given percentile,
+        or the maximum for the overflow bucket."""
+        if not self.count:
+            return None
+        rank = percent / 100.0 * self.count
+        seen = 0
+        for index, count in enumerate(self.buckets):
+            seen += count
+            if count and seen >= rank:
+                return HISTOGRAM_BOUNDS[index] if index < len(HISTOGRAM_BOUNDS) else self.max
+        return self.max
+
+    def snapshot(self):
+        return {
+            'count': self.count,
+            'total': self.total,
+            'min': self.min,
+            'max': self.max,
+            'mean': self.total / self.count if self.count else None,
+            'p50': self.percentile(50),
+            'p99': self.percentile(99),
+            'buckets': list(self.buckets),
+        }
+
+
+class Instrumentation(object):
+    """Counters and latency histograms of a TSL2561.
+
+    Bus reads and writes are counted per register and timed in the 'bus'
+    histogram, integration waits, lux conversions and whole TSL2561.read()
+    calls in the 'integration', 'conversion' and 'reading' ones, and failed
+    bus transactions and missed read deadlines are counted per operation.
+    retries counts reads retried after a bus error.  Hooks added with
+    add_hook() are called as hook(event, register, elapsed) for every
+    event, with event one of 'read', 'write', 'integration', 'conversion',
+    'reading', 'error' or 'retry' and register None when not applicable.
+    """
+
+    def __init__(self):
+        self._hooks = []
+        self.histograms = {
+            'bus': Histogram(),
+            'integration': Histogram(),
+            'conversion': Histogram(),
+            'reading': Histogram(),
+        }
+        self.reset()
+
+    def reset(self):
+        self.reads = {}
+        self.writes = {}
+        self.errors = {}
+        self.retries = 0
+        for histogram in self.histograms.values():
+            histogram.reset()
+
+    def add_hook(self, hook):
+        self._hooks.append(hook)
+
+    def remove_hook(self, hook):
+        self._hooks.remove(hook)
+
+    def _notify(self, event, register, elapsed):
+        for hook in self._hooks:
+            hook(event, register, elapsed)
+
+    def record_bus(self, event, register, elapsed):
+        counters = self.reads if event == 'read' else self.writes
+        counters[register] = counters.get(register, 0) + 1
+        self.histograms['bus'].record(elapsed)
+        self._notify(event, register, elapsed)
+
+    def record_error(self, operation, register, elapsed):
+        self.errors[operation] = self.errors.get(operation, 0) + 1
+        self._notify('error', register, elapsed)
+
+    def record_retry(self, elapsed):
+        self.retries += 1
+        self._notify('retry', None, elapsed)
+
+    def record(self, event, elapsed):
+        """Records an 'integration', 'conversion' or 'reading' duration."""
+        self.histograms[event].record(elapsed)
+        self._notify(event, None, elapsed)
+
+    def snapshot(self):
+        """Returns a copy of all counters and histogram summaries."""
+        return {
+            'reads': dict(self.reads),
+            'writes': dict(self.writes),
+            'errors': dict(self.errors),
+            'retries': self.retries,
+            'histograms': dict((name, histogram.snapshot()) for name, histogram in self.histograms.items()),
+        }
+
+
+class InstrumentedDevice(object):
+    """Wraps an I2C device, reporting every transaction to an
+    Instrumentation.  Registers are recorded without the command bits."""
+
+    def __init__(self, device, instrumentation):
+        self.device = device
+        self._instrumentation = instrumentation
+        if hasattr(device, 'read_channels'):
+            self.read_channels = self._read_channels
+
+    def _read_channels(self):
+        return self._call('read', 'read_channels', _TSL2561.TSL2561_REGISTER_CHAN0_LOW)
+
+    def __getattr__(self, name):
+        return getattr(self.device, name)
+
+    def _call(self, event, operation, register, *args):
+        start = _TSL2561._monotonic()
+        try:
+            result = getattr(self.device, operation)(*args)
+        except Exception:
+            self._instrumentation.record_error(operation, register, _TSL2561._monotonic() - start)
+            raise
+        self._instrumentation.record_bus(event, register, _TSL2561._monotonic() - start)
+        return result
+
+    def write8(self, register, value):
+        return self._call('write', 'write8', register & 0x0F, register, value)
+
+    def write16(self, register, value):
+        return self._call('write', 'write16', register & 0x0F, register, value)
+
+    def writeRaw8(self, value):
+        return self._call('write', 'writeRaw8', value & 0x0F, value)
+
+    def readU8(self, register):
+        return self._call('read', 'readU8', register & 0x0F, register)
+
+    def readU16LE(self, register):
+        return self._call('read', 'readU16LE', register & 0x0F, register)
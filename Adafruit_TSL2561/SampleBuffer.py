@@ -0,0 +1,127 @@
+# Copyright (c) 2015 Massimo Gaggero
+# Author: Massimo Gaggero
+from array import array
+
+from . import TSL2561 as _TSL2561
+
+
+FIELDS = ('timestamp', 'broadband', 'ir', 'config')
+
+
+class SampleBuffer(object):
+    """Fixed capacity ring buffer of timestamped raw samples.
+
+    Samples are kept in typed arrays: timestamps as doubles, broadband and
+    ir counts as unsigned shorts and the gain and integration time as one
+    byte holding the Timing Register value.  When full, the oldest sample is
+    overwritten.  Lux is only computed on request, from the stored counts.
+
+    The buffer can be fed by a sensor with TSL2561.add_sink(buffer).
+    """
+
+    def __init__(self, capacity, package=_TSL2561.TSL2561_PACKAGE_T):
+        if capacity <= 0:
+            raise ValueError('Unexpected capacity {0}. Set to a positive number of samples'.format(capacity))
+        self.capacity = capacity
+        self.package = package
+        self._arrays = {
+            'timestamp': array('d', [0.0]) * capacity,
+            'broadband': array('H', [0]) * capacity,
+            'ir': array('H', [0]) * capacity,
+            'config': array('B', [0]) * capacity,
+        }
+        self._next = 0
+        self._count = 0
+
+    def __len__(self):
+        return self._count
+
+    @property
+    def start(self):
+        """Storage index of the oldest sample."""
+        return (self._next - self._count) % self.capacity
+
+    def append(self, timestamp, broadband, ir, config):
+        arrays = self._arrays
+        index = self._next
+        arrays['timestamp'][index] = timestamp
+        arrays['broadband'][index] = broadband
+        arrays['ir'][index] = ir
+        arrays['config'][index] = config
+        self._next = (index + 1) % self.capacity
+        if self._count < self.capacity:
+            self._count += 1
+
+    def clear(self):
+        self._next = 0
+        self._count = 0
+
+    def _index(self, position):
+        if position < 0:
+            position += self._count
+        if not 0 <= position < self._count:
+            raise IndexError('Sample index out of range')
+        return (self.start + position) % self.capacity
+
+    def __getitem__(self, position):
+        """Returns (timestamp, broadband, ir, config) of a sample, 0 being the
+        oldest and -1 the newest."""
+        index = self._index(position)
+        arrays = self._arrays
+        return arrays['timestamp'][index], arrays['broadband'][index], arrays['ir'][index], arrays['config'][index]
+
+    def values(self, field, window=None):
+        """Returns the values of field for the newest window samples (all
+        samples if None), oldest first, as an array copy."""
+        if field not in self._arrays:
+            raise ValueError('Unexpected field {0}. Set to one of {1}'.format(field, ', '.join(FIELDS)))
+        count = self._count if window is None else min(window, self._count)
+        data = self._arrays[field]
+        first = (self._next - count) % self.capacity
+        if first + count <= self.capacity:
+            return data[first:first + count]
+        return data[first:] + data[:self._next]
+
+    def min(self, field='broadband', window=None):
+        values = self.values(field, window)
+        return min(values) if values else None
+
+    def max(self, field='broadband', window=None):
+        values = self.values(field, window)
+        return max(values) if values else None
+
+    def mean(self, field='broadband', window=None):
+        values = self.values(field, window)
+        return float(sum(values)) / len(values) if values else None
+
+    def percentile(self, percent, field='broadband', window=None):
+        """Returns the nearest rank percentile of field."""
+        values = sorted(self.values(field, window))
+        if not values:
+            return None
+        rank = int(round(percent / 100.0 * (len(values) - 1)))
+        return values[rank]
+
+    def memoryview(self, field):
+        """Returns a zero copy view of the storage of field.  Storage is in
+        ring order: the oldest sample is at start and only the first
+        len(buffer) entries are valid until the buffer wraps."""
+        return memoryview(self._arrays[field])
+
+    def as_numpy(self, field):
+        """Returns a zero copy NumPy view of the storage of field, in the ring
+        order described in memoryview().  Requires NumPy."""
+        import numpy as np
+        data = self._arrays[field]
+        return np.frombuffer(data, dtype=np.dtype(data.typecode))
+
+    def lux(self, position=-1):
+        """Computes the lux value of one sample, by default the newest."""
+        timestamp, broadband, ir, config = self[position]
+        return _TSL2561.compute_lux(broadband, ir, config & 0x03, config & _TSL2561.TSL2561_GAIN_16x, self.package)
+
+    def lux_values(self, window=None):
+        """Computes the lux values of the newest window samples, oldest first."""
+        package = self.package
+        return [_TSL2561.compute_lux(broadband, ir, config & 0x03, config & _TSL2561.TSL2561_GAIN_16x, package)
+                for broadband, ir, config in zip(self.values('broadband', window), self.values('ir', window), self.values('config', window))]
@@ -0,0 +1,185 @@
+# Copyright (c) 2015 Massimo Gaggero
+# Author: Massimo Gaggero
+import mmap
+import os
+import struct
+import threading
+
+from . import TSL2561 as _TSL2561
+
+
+MAGIC = b'TSL2561L'
+VERSION = 1
+
+# Header: magic, format version, package, record size, padding to 16 bytes.
+HEADER = struct.Struct('<8sHBB4x')
+
+# Record: timestamp, broadband, ir, config (gain | integration time), sensor id.
+RECORD = struct.Struct('<dHHBB')
+
+# NumPy dtype of a record, see SampleLogReader.as_numpy().
+RECORD_DTYPE = [('timestamp', '<f8'), ('broadband', '<u2'), ('ir', '<u2'), ('config', 'u1'), ('sensor_id', 'u1')]
+
+
+class _Sink(object):
+    """Sensor sink appending to a SampleLogWriter under one sensor id."""
+
+    def __init__(self, writer, sensor_id):
+        self._writer = writer
+        self._sensor_id = sensor_id
+
+    def append(self, timestamp, broadband, ir, config):
+        self._writer.append(timestamp, broadband, ir, config, self._sensor_id)
+
+
+class SampleLogWriter(object):
+    """Appends fixed width binary sample records to a log file.
+
+    Records are packed into a buffer and written batch_size at a time, or
+    by the first append once fsync_interval seconds passed since the last
+    fsync, the file being fsynced then.  A new file gets a header recording the package,
+    an existing one must have been written for the same package and is cut
+    back to its last complete record.
+
+    Thread safe, so sensors sampled by different threads can share one log.
+    The writer can be fed by a sensor with TSL2561.add_sink(writer), its
+    records carrying sensor_id, or with TSL2561.add_sink(writer.sink(id))
+    to tell sensors apart.
+    """
+
+    def __init__(self, path, package=_TSL2561.TSL2561_PACKAGE_T, sensor_id=0, batch_size=256, fsync_interval=10.0):
+        self.package = package
+        self.sensor_id = sensor_id
+        self._batch_size = batch_size
+        self._fsync_interval = fsync_interval
+        self._buffer = bytearray()
+        self._pending = 0
+        # _lock guards the buffer, _write_lock keeps flushed batches in
+        # order without blocking appends during file writes and fsyncs.
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self._file = open(path, 'ab+')
+        self._file.seek(0, os.SEEK_END)
+        if self._file.tell() == 0:
+            self._file.write(HEADER.pack(MAGIC, VERSION, package, RECORD.size))
+            self._file.flush()
+        else:
+            size = self._file.tell()
+            self._file.seek(0)
+            header = read_header(self._file.read(HEADER.size))
+            if header[1] != package:
+                raise ValueError('Log {0} was written for package {1}, not {2}'.format(path, header[1], package))
+            # Drop a partial record left by a crash, or new records would be
+            # appended out of alignment.
+            partial = (size - HEADER.size) % RECORD.size
+            if partial:
+                self._file.truncate(size - partial)
+        self._last_fsync = _TSL2561._monotonic()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def sink(self, sensor_id):
+        """Returns a sensor sink appending records with sensor_id."""
+        return _Sink(self, sensor_id)
+
+    def append(self, timestamp, broadband, ir, config, sensor_id=None):
+        record = RECORD.pack(timestamp, broadband, ir, config, self.sensor_id if sensor_id is None else sensor_id)
+        with self._lock:
+            self._buffer += record
+            self._pending += 1
+            due = self._pending >= self._batch_size or _TSL2561._monotonic() - self._last_fsync >= self._fsync_interval
+        if due:
+            self.flush()
+
+    def flush(self, fsync=False):
+        """Writes buffered records, fsyncing if forced or due."""
+        with self._write_lock:
+            with self._lock:
+                buffer = self._buffer
+                self._buffer = bytearray()
+                self._pending = 0
+            if buffer:
+                self._file.write(buffer)
+                self._file.flush()
+            now = _TSL2561._monotonic()
+            if fsync or now - self._last_fsync >= self._fsync_interval:
+                os.fsync(self._file.fileno())
+                self._last_fsync = now
+
+    def close(self):
+        if self._file is None:
+            return
+        self.flush(fsync=True)
+        self._file.close()
+        self._file = None
+
+
+def read_header(data):
+    """Returns (version, package) of a log header."""
+    if len(data) < HEADER.size:
+        raise ValueError('Not a TSL2561 sample log: file too short')
+    magic, version, package, record_size = HEADER.unpack_from(data)
+    if magic != MAGIC:
+        raise ValueError('Not a TSL2561 sample log: bad magic {0!r}'.format(magic))
+    if version != VERSION or record_size != RECORD.size:
+        raise ValueError('Unsupported TSL2561 sample log version {0}'.format(version))
+    return version, package
+
+
+class SampleLogReader(object):
+    """Memory maps a sample log for reading without a parsing step.
+
+    Records are available as a memoryview of the mapped bytes, as a NumPy
+    structured array of RECORD_DTYPE viewing the mapping, or one at a time
+    by index.  A trailing partial record, e.g. from a crash while writing,
+    is ignored.  Views must be released before close().
+    """
+
+    def __init__(self, path):
+        self._file = open(path, 'rb')
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        self.version, self.package = read_header(self._map[:HEADER.size])
+        self._count = (len(self._map) - HEADER.size) // RECORD.size
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __len__(self):
+        return self._count
+
+    def __getitem__(self, index):
+        """Returns (timestamp, broadband, ir, config, sensor_id) of a record."""
+        if index < 0:
+            index += self._count
+        if not 0 <= index < self._count:
+            raise IndexError('Record index out of range')
+        return RECORD.unpack_from(self._map, HEADER.size + index * RECORD.size)
+
+    def memoryview(self):
+        """Returns a view of the packed records, RECORD.size bytes each."""
+        return memoryview(self._map)[HEADER.size:HEADER.size + self._count * RECORD.size]
+
+    def as_numpy(self):
+        """Returns a read only structured array viewing the records.  Requires
+        NumPy."""
+        import numpy as np
+        return np.frombuffer(self._map, dtype=np.dtype(RECORD_DTYPE), count=self._count, offset=HEADER.size)
+
+    def lux(self, index):
+        """Computes the lux value of one record."""
+        timestamp, broadband, ir, config, sensor_id = self[index]
+        return _TSL2561.compute_lux(broadband, ir, config & 0x03, config & _TSL2561.TSL2561_GAIN_16x, self.package)
+
+    def close(self):
+        if self._map is None:
+            return
+        self._map.close()
+        self._file.close()
+        self._map = None
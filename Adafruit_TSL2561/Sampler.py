@@ -0,0 +1,129 @@
+# Copyright (c) 2015 Massimo Gaggero
+# Author: Massimo Gaggero
+import collections
+import logging
+import threading
+
+from . import TSL2561 as _TSL2561
+
+
+# Immutable reading published by BackgroundSampler.  timestamp is wall clock
+# time (the time() of the sensor clock) of the acquisition.
+Sample = collections.namedtuple('Sample', 'broadband ir lux timestamp gain integration_time')
+
+
+class BackgroundSampler(object):
+    """Samples a TSL2561 on a daemon thread and caches the newest reading.
+
+    With interval None the sensor runs in continuous mode and every completed
+    integration is published; otherwise one read is made every interval
+    seconds.  Readers call get(), which returns the cached Sample at once
+    when it is recent enough and only waits for the next one otherwise.
+    The sampler must be the only user of the sensor while running.
+    """
+
+    def __init__(self, sensor, interval=None):
+        self._logger = logging.getLogger('Adafruit_TSL2561.Sampler')
+        self._sensor = sensor
+        self._interval = interval
+        # Replaced as a whole on each new sample; readers never lock to get it.
+        self._latest = None
+        self._condition = threading.Condition()
+        self._stopping = threading.Event()
+        self._thread = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    @property
+    def sensor(self):
+        return self._sensor
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    @property
+    def latest(self):
+        """The newest Sample, or None before the first one."""
+        return self._latest
+
+    def start(self):
+        if self.running:
+            return
+        self._stopping.clear()
+        self._thread = threading.Thread(target=self._run, name='TSL2561 sampler')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self, timeout=None):
+        """Stops sampling, waiting for the current integration to end."""
+        if self._thread is None:
+            return
+        self._stopping.set()
+        self._thread.join(timeout)
+        self._thread = None
+        with self._condition:
+            self._condition.notify_all()
+
+    def _publish(self, broadband, ir):
+        sensor = self._sensor
+        self._latest = Sample(broadband, ir, sensor.calculate_lux(broadband, ir), sensor._clock.time(), sensor._gain, sensor._integration_time)
+        with self._condition:
+            self._condition.notify_all()
+
+    def _run(self):
+        try:
+            if self._interval is None:
+                stream = self._sensor.stream()
+                try:
+                    for broadband, ir in stream:
+                        self._publish(broadband, ir)
+                        if self._stopping.is_set():
+                            break
+                finally:
+                    stream.close()
+            else:
+                clock = self._sensor._clock
+                deadline = clock.monotonic()
+                while not self._stopping.is_set():
+                    self._publish(*self._sensor.read_raw_luminosity())
+                    deadline += self._interval
+                    clock.wait(self._stopping, max(0, deadline - clock.monotonic()))
+        except Exception:
+            self._logger.exception('Sampling stopped by an error')
+        finally:
+            # Wake up readers so they see the sampler is gone.
+            with self._condition:
+                self._condition.notify_all()
+
+    def _fresh(self, sample, max_age):
+        return sample is not None and (max_age is None or self._sensor._clock.time() - sample.timestamp <= max_age)
+
+    def get(self, max_age=None, timeout=None):
+        """Returns the newest Sample if it is at most max_age seconds old (any
+        age if None), otherwise waits for a recent enough one.  Returns None
+        if timeout seconds pass or sampling stops first."""
+        sample = self._latest
+        if self._fresh(sample, max_age):
+            return sample
+
+        end = None if timeout is None else _TSL2561._monotonic() + timeout
+        with self._condition:
+            while True:
+                sample = self._latest
+                if self._fresh(sample, max_age):
+                    return sample
+                if not self.running:
+                    return None
+                if end is None:
+                    self._condition.wait()
+                else:
+                    remaining = end - _TSL2561._monotonic()
+                    if remaining <= 0:
+                        return None
+                    self._condition.wait(remaining)
@@ -0,0 +1,205 @@
+# Copyright (c) 2015 Massimo Gaggero
+# Author: Massimo Gaggero
+import heapq
+import itertools
+import logging
+import threading
+
+from . import Clock as _Clock
+from . import TSL2561 as _TSL2561
+
+
+# Event kinds: power a sensor on to start an integration, read it and power
+# it off once the integration completed.
+_START = 0
+_READ = 1
+
+
+class ScheduledSensor(object):
+    """A sensor sampled by a BusScheduler, with its sampling statistics.
+
+    latency is measured from the time a sample was due to the time its
+    counts were read; samples later than max_latency count as misses.
+    """
+
+    def __init__(self, sensor, rate, max_latency, callback):
+        self.sensor = sensor
+        self.period = 1.0 / rate
+        self.max_latency = max_latency
+        self.callback = callback
+        self.integration_time = self._pick_integration_time(sensor, min(self.period, max_latency))
+        self.latest = None
+        self.samples = 0
+        self.misses = 0
+        self.skipped = 0
+        self.errors = 0
+        self.worst_latency = 0.0
+
+    @staticmethod
+    def _pick_integration_time(sensor, budget):
+        """Returns the longest integration time not longer than the
+        configured one that completes within budget seconds."""
+        integration_time = sensor._deadline_integration_time(budget)
+        if integration_time is None:
+            raise ValueError('No integration time completes within {0:0.3f} s. Lower the rate or raise max_latency'.format(budget))
+        return integration_time
+
+    @property
+    def delay(self):
+        return _TSL2561._INTEGRATION_DELAYS[self.integration_time]/1000.0
+
+    def snapshot(self):
+        return {
+            'address': self.sensor._address,
+            'rate': 1.0 / self.period,
+            'integration_time': self.integration_time,
+            'samples': self.samples,
+            'misses': self.misses,
+            'skipped': self.skipped,
+            'errors': self.errors,
+            'worst_latency': self.worst_latency,
+        }
+
+
+class BusScheduler(object):
+    """Samples sensors sharing a bus, each at its own rate.
+
+    Each sensor gets the longest integration time, up to the configured one,
+    that fits both its sampling period and its maximum latency.  A sensor is
+    powered on when its next sample is due and read and powered off as soon
+    as that integration completes, so integrations of different sensors
+    overlap and the bus is only used at the start and end of each one.
+    Sensors with no sample due stay powered down.
+
+    A sample started late because the bus was busy may miss its latency;
+    samples due while the previous one of the same sensor is still running
+    are skipped.  Both are counted per sensor, along with the time spent in
+    bus transactions.
+
+    Time is taken from clock, by default the clock of the first sensor
+    added, so a Clock.VirtualClock schedules simulated sensors faster than
+    real time.
+    """
+
+    def __init__(self, clock=None):
+        self._logger = logging.getLogger('Adafruit_TSL2561.Scheduler')
+        self._clock = clock
+        self._sensors = []
+        self._stopping = threading.Event()
+        self.bus_time = 0.0
+        self.elapsed = 0.0
+
+    @property
+    def sensors(self):
+        return list(self._sensors)
+
+    def add(self, sensor, rate, max_latency=None, callback=None):
+        """Samples sensor rate times per second, each sample completing at
+        most max_latency seconds (by default one period) after it is due.
+        callback(scheduled, reading) is called with a TSL2561Reading for
+        every sample.  Returns the ScheduledSensor."""
+        if rate <= 0:
+            raise ValueError('Unexpected rate {0}. Set to a positive number of samples per second'.format(rate))
+        if sensor._continuous:
+            raise RuntimeError('Sensor is in continuous mode. Call stop() first')
+        scheduled = ScheduledSensor(sensor, rate, 1.0 / rate if max_latency is None else max_latency, callback)
+        sensor.configure(integration_time=scheduled.integration_time)
+        if self._clock is None:
+            self._clock = sensor._clock
+        self._sensors.append(scheduled)
+        return scheduled
+
+    def utilization(self):
+        """Fraction of the time run() spent in bus transactions."""
+        return self.bus_time / self.elapsed if self.elapsed else 0.0
+
+    def report(self):
+        return {
+            'elapsed': self.elapsed,
+            'bus_time': self.bus_time,
+            'utilization': self.utilization(),
+            'sensors': [scheduled.snapshot() for scheduled in self._sensors],
+        }
+
+    def stop(self):
+        """Makes run() return.  Safe to call from another thread."""
+        self._stopping.set()
+
+    def _bus(self, scheduled, operation):
+        """Runs the bus transactions of operation and returns (True, result),
+        or (False, None) when they failed."""
+        clock = self._clock
+        start = clock.monotonic()
+        try:
+            with scheduled.sensor._bus_lock:
+                return True, operation()
+        except (IOError, OSError) as error:
+            scheduled.errors += 1
+            self._logger.warning('Sensor 0x{0:02X} failed: {1}'.format(scheduled.sensor._address, error))
+            scheduled.sensor._recover()
+            return False, None
+        finally:
+            self.bus_time += clock.monotonic() - start
+
+    def _read(self, scheduled):
+        sensor = scheduled.sensor
+        counts = sensor._read_counts()
+        sensor._disable()
+        return counts
+
+    def run(self, duration=None):
+        """Samples the sensors until stop() is called or duration seconds
+        passed, then powers down any sensor still integrating."""
+        self._stopping.clear()
+        clock = self._clock if self._clock is not None else _Clock.SYSTEM_CLOCK
+        start = clock.monotonic()
+        end = None if duration is None else start + duration
+        sequence = itertools.count()
+        events = [(start, next(sequence), _START, scheduled, start) for scheduled in self._sensors]
+        heapq.heapify(events)
+        integrating = set()
+        try:
+            while events and not self._stopping.is_set():
+                when, number, kind, scheduled, due = events[0]
+                now = clock.monotonic()
+                if end is not None and when >= end:
+                    break
+                if when > now:
+                    clock.wait(self._stopping, when - now)
+                    continue
+                heapq.heappop(events)
+
+                if kind == _START:
+                    powered, result = self._bus(scheduled, scheduled.sensor._enable)
+                    if powered:
+                        integrating.add(scheduled)
+                        heapq.heappush(events, (clock.monotonic() + scheduled.delay, next(sequence), _READ, scheduled, due))
+                        continue
+                    # The sensor did not power on; try again next period.
+                else:
+                    integrating.discard(scheduled)
+                    read, counts = self._bus(scheduled, lambda: self._read(scheduled))
+                    if read:
+                        latency = clock.monotonic() - due
+                        scheduled.samples += 1
+                        scheduled.worst_latency = max(scheduled.worst_latency, latency)
+                        if latency > scheduled.max_latency:
+                            scheduled.misses += 1
+                        sensor = scheduled.sensor
+                        scheduled.latest = _TSL2561.TSL2561Reading(counts[0], counts[1], sensor._gain, sensor._integration_time, sensor._package, clock.time())
+                        sensor._feed_sinks(counts[0], counts[1], sensor._gain | sensor._integration_time)
+                        if scheduled.callback is not None:
+                            scheduled.callback(scheduled, scheduled.latest)
+
+                # Samples that came due while this one ran are skipped.
+                due += scheduled.period
+                now = clock.monotonic()
+                if due < now:
+                    missed = int((now - due) / scheduled.period) + 1
+                    scheduled.skipped += missed
+                    due += missed * scheduled.period
+                heapq.heappush(events, (due, next(sequence), _START, scheduled, due))
+        finally:
+            for scheduled in integrating:
+                self._bus(scheduled, scheduled.sensor._disable)
+            self.elapsed += clock.monotonic() - start
@@ -0,0 +1,232 @@
+# Copyright (c) 2015 Massimo Gaggero
+# Author: Massimo Gaggero
+import math
+
+from . import Clock as _Clock
+from . import TSL2561 as _TSL2561
+
+
+# Nominal integration period (s) of each integration time code.
+_INTEGRATION_PERIODS = _TSL2561._INTEGRATION_PERIODS
+
+# Full scale ADC counts of each integration time code.
+_MAX_COUNTS = {
+    _TSL2561.TSL2561_INTEGRATIONTIME_13MS:  5047,
+    _TSL2561.TSL2561_INTEGRATIONTIME_101MS: 37177,
+    _TSL2561.TSL2561_INTEGRATIONTIME_402MS: 65535,
+}
+
+# Bytes on the wire, including the address byte(s), of each transaction type.
+_BYTES_WRITE_RAW8 = 2
+_BYTES_WRITE8     = 3
+_BYTES_WRITE16    = 4
+_BYTES_READ8      = 4
+_BYTES_READ16     = 5
+
+
+def constant(broadband, ir):
+    """Returns a scene with steady light.  Scenes are callables returning the
+    (broadband, ir) counts a 402 ms integration at 1x gain would give at the
+    time passed in."""
+    def scene(now):
+        return broadband, ir
+    return scene
+
+
+def steps(levels, period):
+    """Returns a scene cycling through a list of (broadband, ir) levels,
+    holding each one for period seconds."""
+    levels = list(levels)
+    def scene(now):
+        return levels[int(now / period) % len(levels)]
+    return scene
+
+
+def daylight(broadband, ir, period=86400.0):
+    """Returns a scene following a half sine from darkness up to (broadband,
+    ir) and back over period seconds, then dark for the same time."""
+    def scene(now):
+        level = max(0.0, math.sin(math.pi * now / period))
+        return broadband * level, ir * level
+    return scene
+
+
+class SimulatedTSL2561(object):
+    """Register level model of a TSL2561 with the Adafruit_GPIO I2C device
+    interface used by the driver.
+
+    Powering the chip on starts integration cycles; channel registers are
+    updated at the end of each cycle from the scene, scaled by gain and
+    integration time and saturated at the ADC full scale.  Manual integration
+    counts light between setting and clearing the manual bit.  Level interrupts
+    follow the threshold and persistence registers.  Transaction counters
+    and the modeled bus time let benchmarks measure bus usage; with
+    realtime_bus set, every transaction also takes its modeled time.
+    Time comes from clock, a Clock.VirtualClock shared with the driver
+    making simulations run faster than real time.
+    """
+
+    def __init__(self, scene=None, part_id=0x50, bus_speed=100000, realtime_bus=False, clock=None):
+        self.scene = scene if scene is not None else constant(20000, 6000)
+        self.part_id = part_id
+        self.bus_speed = bus_speed
+        self.realtime_bus = realtime_bus
+        self._clock = _Clock.SYSTEM_CLOCK if clock is None else clock
+        self._registers = [0] * 16
+        self._cycle_start = None
+        self._cycles = 0
+        self._out_of_window = 0
+        self._manual_start = None
+        self.interrupt = False
+        self.reset_stats()
+
+    def reset_stats(self):
+        self.reads = 0
+        self.writes = 0
+        self.bus_bytes = 0
+
+    @property
+    def transactions(self):
+        return self.reads + self.writes
+
+    @property
+    def bus_time(self):
+        """Modeled time spent on the wire, with 9 bit times per byte."""
+        return self.bus_bytes * 9.0 / self.bus_speed
+
+    @property
+    def powered(self):
+        return self._registers[_TSL2561.TSL2561_REGISTER_CONTROL] & 0x03 == _TSL2561.TSL2561_CONTROL_POWERON
+
+    def _transfer(self, nbytes):
+        self.bus_bytes += nbytes
+        if self.realtime_bus:
+            self._clock.sleep(nbytes * 9.0 / self.bus_speed)
+
+    def _integration_time(self):
+        return self._registers[_TSL2561.TSL2561_REGISTER_TIMING] & 0x03
+
+    def _word(self, register):
+        return self._registers[register] | (self._registers[register + 1] << 8)
+
+    def _update(self):
+        """Completes the integration cycles elapsed since the last update."""
+        if self._cycle_start is None or self._integration_time() == _TSL2561.TSL2561_INTEGRATIONTIME_MANUAL:
+            return
+        period = _INTEGRATION_PERIODS[self._integration_time()]
+        completed = int((self._clock.monotonic() - self._cycle_start) / period)
+        if completed <= self._cycles:
+            return
+        # Only the last 16 cycles can matter for persistence.
+        for cycle in range(max(self._cycles + 1, completed - 15), completed + 1):
+            self._complete_cycle(self._cycle_start + cycle * period)
+        self._cycles = completed
+
+    def _store_counts(self, end, period, maximum):
+        """Sets the channel registers for an integration of period seconds
+        ending at end and returns the counts."""
+        factor = period / 0.402
+        if self._registers[_TSL2561.TSL2561_REGISTER_TIMING] & _TSL2561.TSL2561_GAIN_16x:
+            factor *= 16
+        broadband, ir = self.scene(end)
+        counts = [min(maximum, max(0, int(broadband * factor))), min(maximum, max(0, int(ir * factor)))]
+        for register, value in zip((_TSL2561.TSL2561_REGISTER_CHAN0_LOW, _TSL2561.TSL2561_REGISTER_CHAN1_LOW), counts):
+            self._registers[register] = value & 0xFF
+            self._registers[register + 1] = value >> 8
+        return counts
+
+    def _complete_cycle(self, end):
+        itime = self._integration_time()
+        counts = self._store_counts(end, _INTEGRATION_PERIODS[itime], _MAX_COUNTS[itime])
+
+        interrupt = self._registers[_TSL2561.TSL2561_REGISTER_INTERRUPT]
+        if interrupt & 0x30 != _TSL2561.TSL2561_INTERRUPT_LEVEL:
+            return
+        persistence = interrupt & 0x0F
+        low = self._word(_TSL2561.TSL2561_REGISTER_THRESHHOLDL_LOW)
+        high = self._word(_TSL2561.TSL2561_REGISTER_THRESHHOLDH_LOW)
+        if counts[0] < low or counts[0] > high:
+            self._out_of_window += 1
+        else:
+            self._out_of_window = 0
+        if persistence == 0 or self._out_of_window >= persistence:
+            self.interrupt = True
+
+    def _restart(self):
+        self._cycle_start = self._clock.monotonic() if self.powered else None
+        self._cycles = 0
+        self._out_of_window = 0
+
+    def _write(self, register, value):
+        self._update()
+        was_powered = self.powered
+        self._registers[register] = value & 0xFF
+        if register == _TSL2561.TSL2561_REGISTER_CONTROL:
+            if self.powered and not was_powered:
+                for channel in range(_TSL2561.TSL2561_REGISTER_CHAN0_LOW, _TSL2561.TSL2561_REGISTER_CHAN1_HIGH + 1):
+                    self._registers[channel] = 0
+                self._restart()
+            elif not self.powered:
+                self._cycle_start = None
+        elif register == _TSL2561.TSL2561_REGISTER_TIMING:
+            self._restart()
+            manual = value & _TSL2561.TSL2561_MANUAL_BIT
+            if manual and self.powered and self._manual_start is None:
+                self._manual_start = self._clock.monotonic()
+            elif not manual and self._manual_start is not None:
+                end = self._clock.monotonic()
+                self._store_counts(end, end - self._manual_start, 0xFFFF)
+                self._manual_start = None
+
+    def _read(self, register):
+        self._update()
+        if register == _TSL2561.TSL2561_REGISTER_ID:
+            return self.part_id
+        return self._registers[register]
+
+    def write8(self, register, value):
+        self.writes += 1
+        self._transfer(_BYTES_WRITE8)
+        self._write(register & 0x0F, value)
+
+    def write16(self, register, value):
+        self.writes += 1
+        self._transfer(_BYTES_WRITE16)
+        register &= 0x0F
+        self._write(register, value & 0xFF)
+        self._write(register + 1, (value >> 8) & 0xFF)
+
+    def writeRaw8(self, value):
+        self.writes += 1
+        self._transfer(_BYTES_WRITE_RAW8)
+        if value & _TSL2561.TSL2561_CLEAR_BIT:
+            self.interrupt = False
+
+    def readU8(self, register):
+        self.reads += 1
+        self._transfer(_BYTES_READ8)
+        return self._read(register & 0x0F)
+
+    def readU16LE(self, register):
+        self.reads += 1
+        self._transfer(_BYTES_READ16)
+        register &= 0x0F
+        return self._read(register) | (self._read(register + 1) << 8)
+
+
+class SimulatedI2C(object):
+    """Stand-in for the Adafruit_GPIO.I2C module, to pass as the i2c argument
+    of TSL2561.  Each TSL2561 address gets its own SimulatedTSL2561 built
+    with the keyword arguments given here; other addresses fail like an
+    unanswered transaction."""
+
+    def __init__(self, **kwargs):
+        self._kwargs = kwargs
+        self.devices = {}
+
+    def get_i2c_device(self, address, busnum=None, **kwargs):
+        if address not in (_TSL2561.TSL2561_FLOAT_I2CADDR, _TSL2561.TSL2561_GND_I2CADDR, _TSL2561.TSL2561_VDD_I2CADDR):
+            raise IOError('No device at address 0x{0:02X}'.format(address))
+        if address not in self.devices:
+            self.devices[address] = SimulatedTSL2561(**self._kwargs)
+        return self.devices[address]
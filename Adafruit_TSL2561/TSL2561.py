@@ -1,7 +1,13 @@
 # Copyright (c) 2015 Massimo Gaggero
 # Author: Massimo Gaggero
-import time
 import logging
+import threading
+from bisect import bisect_left
+
+from . import Clock as _Clock
+
+# Monotonic clock for measuring real durations, see Clock.SystemClock.
+_monotonic = _Clock._monotonic
 
 # # TSL2561 default address.
 TSL2561_FLOAT_I2CADDR            = 0x39
@@ -33,15 +39,56 @@ TSL2561_BLOCK_BIT                 = 0x10
 TSL2561_CONTROL_POWERON           = 0x03
 TSL2561_CONTROL_POWEROFF          = 0x00
 
+# TSL2561 Interrupt Control Register Fields
+TSL2561_INTERRUPT_DISABLE         = 0x00
+TSL2561_INTERRUPT_LEVEL           = 0x10
+
 # TSL2561 Integration Periods
 TSL2561_INTEGRATIONTIME_13MS      = 0x00
 TSL2561_INTEGRATIONTIME_101MS     = 0x01
 TSL2561_INTEGRATIONTIME_402MS     = 0x02
+TSL2561_INTEGRATIONTIME_MANUAL    = 0x03
+
+# TSL2561 Timing Register manual integration start/stop bit
+TSL2561_MANUAL_BIT                = 0x08
 
 TSL2561_DELAY_INTTIME_13MS        = 15
 TSL2561_DELAY_INTTIME_101MS       = 120
 TSL2561_DELAY_INTTIME_402MS       = 450
 
+# Channel counts at which the ADC is considered saturated
+TSL2561_CLIPPING_13MS             = 4900
+TSL2561_CLIPPING_101MS            = 37000
+TSL2561_CLIPPING_402MS            = 65000
+
+# Nominal integration cycle length (s) of each integration time code.
+_INTEGRATION_PERIODS = {
+    TSL2561_INTEGRATIONTIME_13MS:  0.0137,
+    TSL2561_INTEGRATIONTIME_101MS: 0.101,
+    TSL2561_INTEGRATIONTIME_402MS: 0.402,
+}
+
+# Wait (ms) for a first integration cycle to complete after power on, with
+# margin for the tolerance of the chip oscillator.
+_INTEGRATION_DELAYS = {
+    TSL2561_INTEGRATIONTIME_13MS:  TSL2561_DELAY_INTTIME_13MS,
+    TSL2561_INTEGRATIONTIME_101MS: TSL2561_DELAY_INTTIME_101MS,
+    TSL2561_INTEGRATIONTIME_402MS: TSL2561_DELAY_INTTIME_402MS,
+}
+
+# Time (s) set aside for the bus transactions of a read when choosing an
+# integration time that meets a deadline.
+_DEADLINE_MARGIN = 0.005
+
+# Integration time codes from the shortest to the longest.
+_INTEGRATION_TIMES = (TSL2561_INTEGRATIONTIME_13MS, TSL2561_INTEGRATIONTIME_101MS, TSL2561_INTEGRATIONTIME_402MS)
+
+_CLIPPING = {
+    TSL2561_INTEGRATIONTIME_13MS:  TSL2561_CLIPPING_13MS,
+    TSL2561_INTEGRATIONTIME_101MS: TSL2561_CLIPPING_101MS,
+    TSL2561_INTEGRATIONTIME_402MS: TSL2561_CLIPPING_402MS,
+}
+
 # TSL2561 Package Type
 TSL2561_PACKAGE_T                 = 0x01
 TSL2561_PACKAGE_FN                = 0x02
@@ -52,90 +99,694 @@ TSL2561_PACKAGE_CS                = 0x10
 TSL2561_GAIN_1x                   = 0x00
 TSL2561_GAIN_16x                  = 0x10
 
+# Adafruit_GPIO.GPIO values used to wait on the interrupt pin, repeated here
+# so a stand-in gpio object does not need the library.
+_GPIO_IN      = 1
+_GPIO_FALLING = 2
+_GPIO_PUD_UP  = 2
+
+
+# Fixed point scaling of the datasheet lux algorithm.
+_LUX_SCALE     = 14
+_RATIO_SCALE   = 9
+_CH_SCALE      = 10
+_CHSCALE_TINT0 = 0x7517
+_CHSCALE_TINT1 = 0x0fe7
+
+# Breakpoints (K) of the channel ratio and coefficients (B, M) of each
+# segment of the piecewise lux approximation.  Ratios above the last
+# breakpoint use the trailing zero coefficients.
+_LUX_K_T  = (0x0040, 0x0080, 0x00c0, 0x0100, 0x0138, 0x019a, 0x029a)
+_LUX_B_T  = (0x01f2, 0x0214, 0x023f, 0x0270, 0x016f, 0x00d2, 0x0018, 0x0000)
+_LUX_M_T  = (0x01be, 0x02d1, 0x037b, 0x03fe, 0x01fc, 0x00fb, 0x0012, 0x0000)
+
+_LUX_K_CS = (0x0043, 0x0085, 0x00c8, 0x010a, 0x014d, 0x019a, 0x029a)
+_LUX_B_CS = (0x0204, 0x0228, 0x0253, 0x0282, 0x0177, 0x0101, 0x0037, 0x0000)
+_LUX_M_CS = (0x01ad, 0x02c1, 0x0363, 0x03df, 0x01dd, 0x0127, 0x002b, 0x0000)
+
+# The T, FN and CL packages share one coefficient set.
+_LUX_COEFFICIENTS = {
+    TSL2561_PACKAGE_T:  (_LUX_K_T, _LUX_B_T, _LUX_M_T),
+    TSL2561_PACKAGE_FN: (_LUX_K_T, _LUX_B_T, _LUX_M_T),
+    TSL2561_PACKAGE_CL: (_LUX_K_T, _LUX_B_T, _LUX_M_T),
+    TSL2561_PACKAGE_CS: (_LUX_K_CS, _LUX_B_CS, _LUX_M_CS),
+}
+
+# Fixed point factor normalizing counts to 402 ms and 16x gain, keyed by
+# (integration time, gain).
+_CHANNEL_SCALES = {
+    (TSL2561_INTEGRATIONTIME_13MS,  TSL2561_GAIN_16x): _CHSCALE_TINT0,
+    (TSL2561_INTEGRATIONTIME_101MS, TSL2561_GAIN_16x): _CHSCALE_TINT1,
+    (TSL2561_INTEGRATIONTIME_402MS, TSL2561_GAIN_16x): 1 << _CH_SCALE,
+    (TSL2561_INTEGRATIONTIME_13MS,  TSL2561_GAIN_1x):  _CHSCALE_TINT0 << 4,
+    (TSL2561_INTEGRATIONTIME_101MS, TSL2561_GAIN_1x):  _CHSCALE_TINT1 << 4,
+    (TSL2561_INTEGRATIONTIME_402MS, TSL2561_GAIN_1x):  (1 << _CH_SCALE) << 4,
+}
+
+# Nominal length (s) of the integration _CHANNEL_SCALES normalizes to.
+_NOMINAL_EXPOSURE = 0.402
+
+# Fractional bits of the channel scale of manual exposures.  The 10 bits of
+# the datasheet tables would round the scale of long exposures by percents.
+_EXPOSURE_SCALE = 24
+
+
+def _channel_scale(integration_time, gain, exposure):
+    """Returns the fixed point factor normalizing counts to 402 ms and 16x
+    gain, and its number of fractional bits."""
+    if exposure is None:
+        return _CHANNEL_SCALES[integration_time, gain], _CH_SCALE
+    ch_scale = int(round((1 << _EXPOSURE_SCALE) * _NOMINAL_EXPOSURE / exposure))
+    if gain != TSL2561_GAIN_16x:
+        ch_scale <<= 4
+    return ch_scale, _EXPOSURE_SCALE
+
+
+def compute_lux(ch0, ch1, integration_time=TSL2561_INTEGRATIONTIME_402MS, gain=TSL2561_GAIN_1x, package=TSL2561_PACKAGE_T, exposure=None):
+    """Converts raw channel counts to lux with the integer algorithm of the
+    TSL2561 datasheet.  No bus access is involved.  For manual integrations
+    pass the measured exposure in seconds; counts are then scaled by it and
+    integration_time is ignored."""
+    ch_scale, shift = _channel_scale(integration_time, gain, exposure)
+    channel0 = (ch0 * ch_scale) >> shift
+    channel1 = (ch1 * ch_scale) >> shift
+
+    ratio1 = 0
+    if channel0 != 0:
+        ratio1 = (channel1 << (_RATIO_SCALE+1)) // channel0
+    ratio = (ratio1 + 1) >> 1
+
+    k, b, m = _LUX_COEFFICIENTS[package]
+    segment = bisect_left(k, ratio)
+
+    temp = (channel0 * b[segment]) - (channel1 * m[segment])
+    if temp < 0:
+        temp = 0
+    temp += (1 << (_LUX_SCALE-1))
+
+    return temp >> _LUX_SCALE
+
+
+def compute_lux_array(ch0, ch1, integration_time=TSL2561_INTEGRATIONTIME_402MS, gain=TSL2561_GAIN_1x, package=TSL2561_PACKAGE_T, exposure=None):
+    """Vectorized compute_lux() over NumPy arrays of raw channel counts.
+    Returns an int64 array with the same results as compute_lux().  Requires
+    NumPy."""
+    import numpy as np
+    ch_scale, shift = _channel_scale(integration_time, gain, exposure)
+    channel0 = (np.asarray(ch0, dtype=np.int64) * ch_scale) >> shift
+    channel1 = (np.asarray(ch1, dtype=np.int64) * ch_scale) >> shift
+
+    ratio1 = np.zeros(np.broadcast(channel0, channel1).shape, dtype=np.int64)
+    np.floor_divide(channel1 << (_RATIO_SCALE+1), channel0, out=ratio1, where=channel0 != 0)
+    ratio = (ratio1 + 1) >> 1
+
+    k, b, m = _LUX_COEFFICIENTS[package]
+    segment = np.searchsorted(np.array(k, dtype=np.int64), ratio, side='left')
+
+    temp = channel0 * np.array(b, dtype=np.int64)[segment] - channel1 * np.array(m, dtype=np.int64)[segment]
+    np.maximum(temp, 0, out=temp)
+    temp += (1 << (_LUX_SCALE-1))
+
+    return temp >> _LUX_SCALE
+
+
+class TSL2561DeadlineError(RuntimeError):
+    """Raised when a reading cannot be completed before its deadline."""
+
+
+class TSL2561Reading(object):
+    """One acquisition: raw counts, the settings they were read with and the
+    wall clock time of the read.  Derived values are computed on first
+    access and kept.  exposure is the measured length in seconds of a manual
+    integration, None for the fixed integration times."""
+
+    __slots__ = ('broadband', 'ir', 'gain', 'integration_time', 'package', 'timestamp', 'exposure', '_lux')
+
+    def __init__(self, broadband, ir, gain, integration_time, package, timestamp, exposure=None):
+        self.broadband = broadband
+        self.ir = ir
+        self.gain = gain
+        self.integration_time = integration_time
+        self.package = package
+        self.timestamp = timestamp
+        self.exposure = exposure
+        self._lux = None
+
+    def __repr__(self):
+        return 'TSL2561Reading(broadband={0}, ir={1}, gain={2}, integration_time={3}, package={4}, timestamp={5})'.format(
+            self.broadband, self.ir, self.gain, self.integration_time, self.package, self.timestamp)
+
+    @property
+    def lux(self):
+        if self._lux is None:
+            self._lux = compute_lux(self.broadband, self.ir, self.integration_time, self.gain, self.package, self.exposure)
+        return self._lux
+
+    @property
+    def ir_ratio(self):
+        """Ratio of infrared to broadband counts, 0 in the dark."""
+        if self.broadband == 0:
+            return 0.0
+        return float(self.ir) / self.broadband
+
+    @property
+    def visible(self):
+        """Counts of the visible part of the spectrum only."""
+        return max(0, self.broadband - self.ir)
+
+
+class _Flight(object):
+    """A read in progress that other threads wait for, see
+    TSL2561.read_raw_luminosity().  settings holds the (gain, integration
+    time) the counts in result were read with."""
+
+    __slots__ = ('done', 'result', 'settings', 'error')
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.settings = None
+        self.error = None
+
 
 class TSL2561(object):
-    def __init__(self, address=TSL2561_FLOAT_I2CADDR, package=TSL2561_PACKAGE_T, i2c=None, **kwargs):
+    def __init__(self, address=TSL2561_FLOAT_I2CADDR, package=TSL2561_PACKAGE_T, i2c=None, lazy=False, clock=None, **kwargs):
         self._logger = logging.getLogger('Adafruit_TSL2561.TSL2561')
         # Check the package is valid.
         if package not in [TSL2561_PACKAGE_T, TSL2561_PACKAGE_FN, TSL2561_PACKAGE_CL, TSL2561_PACKAGE_CS]:
             raise ValueError('Unexpected package value {0}.  Set package to one of TSL2561_PACKAGE_T, TSL2561_PACKAGE_FN, TSL2561_PACKAGE_CL, TSL2561_PACKAGE_CS'.format(package))
         self._package = package
-        # Create I2C device.
+        # The I2C device is created by open().
+        self._address = address
+        self._i2c = i2c
+        self._i2c_kwargs = kwargs
+
+        self._integration_time = TSL2561_INTEGRATIONTIME_402MS
+        self._gain = TSL2561_GAIN_1x
+
+        # Source of integration waits, cycle and deadline timing and sample
+        # timestamps, see Clock.  A Clock.VirtualClock shared with a
+        # Simulator.SimulatedTSL2561 runs faster than real time.
+        self._clock = _Clock.SYSTEM_CLOCK if clock is None else clock
+
+        # Shadow copy of the writable registers (CONTROL, TIMING, THRESHOLD
+        # and INTERRUPT), keyed by register address.  A missing entry means
+        # the chip content is unknown and the next write must go to the bus.
+        self._shadow = {}
+
+        # Continuous acquisition state: when running the sensor stays powered
+        # and _cycle_start is the monotonic time of the last power on.
+        self._continuous = False
+        self._cycle_start = None
+        self._last_cycle = 0
+
+        # Instrumentation receiving bus, integration and conversion timings,
+        # see instrument().  None keeps the hot path free of bookkeeping.
+        self._instrumentation = None
+
+        # Objects with an append(timestamp, broadband, ir, config) method fed
+        # with every sample read, see add_sink().
+        self._sinks = []
+
+        # Serializes bus sequences of concurrent threads.  _flight is the
+        # read in progress, joined by threads calling read_raw_luminosity()
+        # while it integrates.
+        self._bus_lock = threading.RLock()
+        self._flight_lock = threading.Lock()
+        self._flight = None
+
+        # A lazy sensor is opened by the first access to _device, see
+        # __getattr__().
+        if not lazy:
+            self.open()
+
+    def __getattr__(self, name):
+        # Only called for attributes that are not set: _device is missing
+        # until the sensor is opened.
+        if name == '_device':
+            self.open()
+            return self.__dict__['_device']
+        raise AttributeError(name)
+
+    def open(self):
+        """Creates the I2C device and configures the sensor.  Done by the
+        constructor unless lazy is True, in which case it happens on first
+        use; calling it again has no effect."""
+        if '_device' in self.__dict__:
+            return
+        i2c = self._i2c
         if i2c is None:
             import Adafruit_GPIO.I2C as I2C
             i2c = I2C
-        self._device = i2c.get_i2c_device(address, **kwargs)
+        device = i2c.get_i2c_device(self._address, **self._i2c_kwargs)
+        if self._instrumentation is not None:
+            from . import Instrumentation
+            device = Instrumentation.InstrumentedDevice(device, self._instrumentation)
+        self._device = device
 
-        self._integration_time = TSL2561_INTEGRATIONTIME_402MS
-        self._gain = TSL2561_GAIN_1x
+        self._shadow.clear()
+        self.configure(gain=self._gain, integration_time=self._integration_time)
+
+    def close(self):
+        """Stops continuous acquisition and releases the I2C device.  A
+        closed sensor is opened again on next use."""
+        if '_device' not in self.__dict__:
+            return
+        self.stop()
+        close = getattr(self._device, 'close', None)
+        if close is not None:
+            close()
+        del self._device
+
+    @property
+    def is_open(self):
+        return '_device' in self.__dict__
 
-        self.set_integration_time(self._integration_time)
-        self.set_gain(self._gain)
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def _write8(self, register, value):
+        """Writes a register unless the shadow copy shows it already holds
+        value."""
+        if self._shadow.get(register) == value:
+            return
+        self._device.write8(TSL2561_COMMAND_BIT | register, value)
+        self._shadow[register] = value
+
+    def _write16(self, register, value):
+        """Writes a little endian word to register and register + 1 unless the
+        shadow copy shows they already hold value."""
+        low = value & 0xFF
+        high = (value >> 8) & 0xFF
+        if self._shadow.get(register) == low and self._shadow.get(register + 1) == high:
+            return
+        self._device.write16(TSL2561_COMMAND_BIT | TSL2561_WORD_BIT | register, value)
+        self._shadow[register] = low
+        self._shadow[register + 1] = high
 
     def _enable(self):
-        self._device.write8(TSL2561_COMMAND_BIT | TSL2561_REGISTER_CONTROL, TSL2561_CONTROL_POWERON)
+        self._write8(TSL2561_REGISTER_CONTROL, TSL2561_CONTROL_POWERON)
 
     def _disable(self):
-        self._device.write8(TSL2561_COMMAND_BIT | TSL2561_REGISTER_CONTROL, TSL2561_CONTROL_POWEROFF)
+        self._write8(TSL2561_REGISTER_CONTROL, TSL2561_CONTROL_POWEROFF)
 
-    def read_raw_luminosity(self):
-        """Reads the raw luminosity from the sensor."""
-        self._enable()
+    def instrument(self, instrumentation=None):
+        """Starts reporting bus transactions, integration waits and lux
+        conversions to an Instrumentation.Instrumentation, created if not
+        given, and returns it."""
+        from . import Instrumentation
+        if instrumentation is None:
+            instrumentation = Instrumentation.Instrumentation()
+        self.uninstrument()
+        self._device = Instrumentation.InstrumentedDevice(self._device, instrumentation)
+        self._instrumentation = instrumentation
+        return instrumentation
+
+    def uninstrument(self):
+        """Stops reporting to the Instrumentation set with instrument()."""
+        if self._instrumentation is None:
+            return
+        self._device = self._device.device
+        self._instrumentation = None
+
+    def add_sink(self, sink):
+        """Feeds every sample read to sink.append(timestamp, broadband, ir,
+        config), config being the Timing Register value (gain | integration
+        time) the sample was read with.  A SampleBuffer.SampleBuffer is a
+        suitable sink.
+
+        Sinks are called once the bus sequence of the read has ended, so a
+        slow sink does not keep the sensor powered or the bus locked.  An
+        error raised by a sink is logged and does not fail the read.
+        """
+        self._sinks.append(sink)
+
+    def remove_sink(self, sink):
+        self._sinks.remove(sink)
+
+    @property
+    def clock(self):
+        return self._clock
+
+    def _sleep(self, seconds):
+        """Waits for integration, timing the wait when instrumented."""
+        if self._instrumentation is None:
+            self._clock.sleep(seconds)
+            return
+        start = self._clock.monotonic()
+        self._clock.sleep(seconds)
+        self._instrumentation.record('integration', self._clock.monotonic() - start)
 
-        if self._integration_time == TSL2561_INTEGRATIONTIME_13MS:
-            time.sleep(TSL2561_DELAY_INTTIME_13MS/1000.0)
-        elif self._integration_time == TSL2561_INTEGRATIONTIME_101MS:
-            time.sleep(TSL2561_DELAY_INTTIME_101MS/1000.0)
+    def _release(self):
+        """Powers the sensor off again unless continuous acquisition is
+        running."""
+        if not self._continuous:
+            self._disable()
+
+    def _integration_delay(self):
+        """Returns the wait for a first integration cycle in seconds."""
+        return _INTEGRATION_DELAYS[self._integration_time]/1000.0
+
+    def _restart_cycle(self):
+        self._cycle_start = self._clock.monotonic()
+        self._last_cycle = 0
+
+    def _next_cycle(self, cycle):
+        """Returns the number of the newest completed integration cycle once
+        cycle number cycle has completed, and the seconds left until then.
+        Cycles follow the nominal period, with the margin of the first cycle
+        wait applied once as an offset."""
+        period = _INTEGRATION_PERIODS[self._integration_time]
+        elapsed = self._clock.monotonic() - self._cycle_start - (self._integration_delay() - period)
+        completed = max(0, int(elapsed / period))
+        if completed >= cycle:
+            return completed, 0
+        return cycle, cycle * period - elapsed
+
+    def _wait_for_cycle(self, cycle):
+        """Sleeps until integration cycle number cycle has completed and
+        returns the number of the newest completed cycle."""
+        completed, remaining = self._next_cycle(cycle)
+        if remaining > 0:
+            self._sleep(remaining)
+        return completed
+
+    def _read_counts(self):
+        # Devices able to do it, like I2CDev.I2CDevDevice, read both channels
+        # in one block transaction.
+        read_channels = getattr(self._device, 'read_channels', None)
+        if read_channels is not None:
+            broadband, ir = read_channels()
         else:
-            time.sleep(TSL2561_DELAY_INTTIME_402MS/1000.0)
+            # Reads a two byte value from channel 0 (visible + infrared)
+            broadband = self._device.readU16LE(TSL2561_COMMAND_BIT | TSL2561_WORD_BIT | TSL2561_REGISTER_CHAN0_LOW)
+
+            # Reads a two byte value from channel 1 (infrared)
+            ir = self._device.readU16LE(TSL2561_COMMAND_BIT | TSL2561_WORD_BIT | TSL2561_REGISTER_CHAN1_LOW)
+
+        return broadband, ir
+
+    def _feed_sinks(self, broadband, ir, config):
+        """Hands a sample read with Timing Register value config to the
+        sinks.  Called without the bus lock held."""
+        if not self._sinks:
+            return
+        timestamp = self._clock.time()
+        for sink in self._sinks:
+            try:
+                sink.append(timestamp, broadband, ir, config)
+            except Exception as error:
+                self._logger.warning('Sink {0!r} failed: {1}'.format(sink, error))
+
+    def start(self):
+        """Powers the sensor on and keeps it integrating until stop() is
+        called.  While running, reads return the newest completed integration
+        without waiting for a full cycle."""
+        with self._bus_lock:
+            if self._continuous:
+                return
+            self._enable()
+            self._restart_cycle()
+            self._continuous = True
 
-        # Reads a two byte value from channel 0 (visible + infrared)
-        broadband = self._device.readU16LE(TSL2561_COMMAND_BIT | TSL2561_WORD_BIT | TSL2561_REGISTER_CHAN0_LOW)
+    def stop(self):
+        """Leaves continuous acquisition mode and powers the sensor off."""
+        with self._bus_lock:
+            if not self._continuous:
+                return
+            self._continuous = False
+            self._disable()
 
-        # Reads a two byte value from channel 1 (infrared)
-        ir = self._device.readU16LE(TSL2561_COMMAND_BIT | TSL2561_WORD_BIT | TSL2561_REGISTER_CHAN1_LOW)
+    def stream(self):
+        """Yields one (broadband, ir) sample per completed integration cycle.
 
-        self._disable()
+        Continuous mode is started if needed, and stopped again when the
+        generator is closed if it was started here.
+        """
+        started = not self._continuous
+        self.start()
+        try:
+            while True:
+                with self._bus_lock:
+                    self._last_cycle = self._wait_for_cycle(self._last_cycle + 1)
+                    broadband, ir = self._read_counts()
+                    config = self._gain | self._integration_time
+                self._feed_sinks(broadband, ir, config)
+                yield broadband, ir
+        finally:
+            if started:
+                self.stop()
+
+    def _recover(self):
+        """Puts the sensor back in a known state after a failed transaction.
+        The chip may or may not have applied the failed write, so the Control
+        and Timing Register shadows are dropped and both registers written
+        again.  A sensor that does not answer is left with unknown shadows."""
+        self._shadow.pop(TSL2561_REGISTER_CONTROL, None)
+        self._shadow.pop(TSL2561_REGISTER_TIMING, None)
+        try:
+            self._enable()
+            self._write8(TSL2561_REGISTER_TIMING, self._gain | self._integration_time)
+            self._release()
+        except (IOError, OSError) as error:
+            self._logger.warning('Failed to restore the sensor state: {0}'.format(error))
+
+    def _acquire(self, integration_time):
+        """Powers the sensor on, integrates once with integration_time and
+        reads both channels.  The configured Timing Register value is restored
+        before powering off, and the sensor is powered off even if a
+        transaction fails."""
+        configured = self._integration_time
+        done = False
+        try:
+            self._enable()
+            if integration_time != configured:
+                self._integration_time = integration_time
+                self._write8(TSL2561_REGISTER_TIMING, self._gain | integration_time)
+            self._sleep(self._integration_delay())
+            broadband, ir = self._read_counts()
+            self._integration_time = configured
+            self._write8(TSL2561_REGISTER_TIMING, self._gain | configured)
+            self._disable()
+            done = True
+        finally:
+            if not done:
+                self._integration_time = configured
+                self._recover()
 
         return broadband, ir
 
+    def _read_raw_luminosity(self):
+        if self._continuous:
+            self._last_cycle = self._wait_for_cycle(1)
+            return self._read_counts()
+
+        return self._acquire(self._integration_time)
+
+    def _join_flight(self):
+        """Reads the sensor, or waits for the read in progress, and returns
+        the completed _Flight."""
+        with self._flight_lock:
+            flight = self._flight
+            leader = flight is None
+            if leader:
+                flight = self._flight = _Flight()
+
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            if flight.result is None:
+                raise RuntimeError('The read in progress was interrupted')
+            return flight
+
+        try:
+            with self._bus_lock:
+                flight.result = self._read_raw_luminosity()
+                flight.settings = (self._gain, self._integration_time)
+        except Exception as error:
+            flight.error = error
+            raise
+        finally:
+            with self._flight_lock:
+                self._flight = None
+            flight.done.set()
+        gain, integration_time = flight.settings
+        self._feed_sinks(flight.result[0], flight.result[1], gain | integration_time)
+        return flight
+
+    def read_raw_luminosity(self):
+        """Reads the raw luminosity from the sensor.
+
+        Thread safe.  A thread calling it while a read by another thread is in
+        progress waits for that read and returns the same counts, or raises
+        the same error, instead of integrating again; the next integration
+        starts with the first call made after the read in progress ended.
+        """
+        return self._join_flight().result
+
     def read_id_register(self):
         """Reads the Device ID and Revision Number of the sensor."""
-        self._enable()
-        val = self._device.readU8(TSL2561_COMMAND_BIT | TSL2561_REGISTER_ID)
-        self._disable()
+        with self._bus_lock:
+            self._enable()
+            val = self._device.readU8(TSL2561_COMMAND_BIT | TSL2561_REGISTER_ID)
+            self._release()
 
         return val
 
-    def read_timing_register(self):
-        """Reads the Timing Register of the sensor."""
-        self._enable()
-        val = self._device.readU8(TSL2561_COMMAND_BIT | TSL2561_REGISTER_TIMING)
-        self._disable()
+    def read_timing_register(self, refresh=False):
+        """Reads the Timing Register of the sensor.  The shadow copy is
+        returned when known, unless refresh is True."""
+        with self._bus_lock:
+            if not refresh and TSL2561_REGISTER_TIMING in self._shadow:
+                return self._shadow[TSL2561_REGISTER_TIMING]
 
-        return val & 0xFF
+            self._enable()
+            val = self._device.readU8(TSL2561_COMMAND_BIT | TSL2561_REGISTER_TIMING) & 0xFF
+            self._release()
 
-    def set_integration_time(self, itime):
-        if itime not in [TSL2561_INTEGRATIONTIME_13MS, TSL2561_INTEGRATIONTIME_101MS, TSL2561_INTEGRATIONTIME_402MS]:
-            raise ValueError('Unexpected integration time value {0}. Set to one of TSL2561_INTEGRATIONTIME_13MS, TSL2561_INTEGRATIONTIME_101MS, TSL2561_INTEGRATIONTIME_402MS'.format(itime))
+            self._shadow[TSL2561_REGISTER_TIMING] = val
+            return val
 
-        self._enable()
+    def is_powered(self, refresh=False):
+        """Returns True if the sensor is powered on.  The shadow copy of the
+        Control Register is used when known, unless refresh is True."""
+        with self._bus_lock:
+            if refresh or TSL2561_REGISTER_CONTROL not in self._shadow:
+                val = self._device.readU8(TSL2561_COMMAND_BIT | TSL2561_REGISTER_CONTROL) & TSL2561_CONTROL_POWERON
+                self._shadow[TSL2561_REGISTER_CONTROL] = val
+            return self._shadow[TSL2561_REGISTER_CONTROL] == TSL2561_CONTROL_POWERON
 
-        self._device.write8(TSL2561_COMMAND_BIT | TSL2561_REGISTER_TIMING, self._gain | itime)
-        self._integration_time = itime
+    def _timing_changed(self):
+        # A TIMING write restarts integration, so a running sensor stays
+        # powered and starts counting cycles again.
+        if self._continuous:
+            self._restart_cycle()
+        self._release()
 
-        self._disable()
-
-    def set_gain(self, gain):
+    def configure(self, gain=None, integration_time=None):
+        """Sets gain and integration time with a single Timing Register write.
+        Fields left to None keep their current value, and nothing is written
+        when the register already holds the requested setting."""
+        if gain is None:
+            gain = self._gain
+        if integration_time is None:
+            integration_time = self._integration_time
+        if integration_time not in [TSL2561_INTEGRATIONTIME_13MS, TSL2561_INTEGRATIONTIME_101MS, TSL2561_INTEGRATIONTIME_402MS]:
+            raise ValueError('Unexpected integration time value {0}. Set to one of TSL2561_INTEGRATIONTIME_13MS, TSL2561_INTEGRATIONTIME_101MS, TSL2561_INTEGRATIONTIME_402MS'.format(integration_time))
         if gain not in [TSL2561_GAIN_1x, TSL2561_GAIN_16x]:
             raise ValueError('Unexpected gain value {0}. Set to one of TSL2561_GAIN_1x, TSL2561_GAIN_16x'.format(gain))
 
-        self._enable()
+        # Waits for a read in progress, whose integration a Timing Register
+        # write would restart.
+        with self._bus_lock:
+            self._gain = gain
+            self._integration_time = integration_time
+            # An unopened sensor gets the settings when open() configures it.
+            if not self.is_open or self._shadow.get(TSL2561_REGISTER_TIMING) == gain | integration_time:
+                return
+
+            self._enable()
+
+            self._write8(TSL2561_REGISTER_TIMING, gain | integration_time)
+
+            self._timing_changed()
+
+    def set_integration_time(self, itime):
+        self.configure(integration_time=itime)
+
+    def set_gain(self, gain):
+        self.configure(gain=gain)
+
+    def set_thresholds(self, low, high):
+        """Programs the interrupt window.  An interrupt fires when channel 0
+        counts fall below low or rise above high."""
+        for value in (low, high):
+            if not 0 <= value <= 0xFFFF:
+                raise ValueError('Unexpected threshold value {0}. Set to a value between 0 and 65535'.format(value))
+        if low > high:
+            raise ValueError('Low threshold {0} is above high threshold {1}'.format(low, high))
 
-        self._device.write8(TSL2561_COMMAND_BIT | TSL2561_REGISTER_TIMING, self._integration_time | gain)
-        self._gain = gain
+        with self._bus_lock:
+            self._enable()
 
-        self._disable()
+            self._write16(TSL2561_REGISTER_THRESHHOLDL_LOW, low)
+            self._write16(TSL2561_REGISTER_THRESHHOLDH_LOW, high)
+
+            self._release()
+
+    def enable_interrupt(self, persistence=1):
+        """Enables level interrupts.  persistence is the number of consecutive
+        integration cycles out of the threshold window needed to fire (0
+        fires after every cycle, 1 on any value out of the window)."""
+        if not 0 <= persistence <= 0x0F:
+            raise ValueError('Unexpected persistence value {0}. Set to a value between 0 and 15'.format(persistence))
+
+        with self._bus_lock:
+            self._enable()
+            self._write8(TSL2561_REGISTER_INTERRUPT, TSL2561_INTERRUPT_LEVEL | persistence)
+            self._release()
+
+    def disable_interrupt(self):
+        with self._bus_lock:
+            self._enable()
+            self._write8(TSL2561_REGISTER_INTERRUPT, TSL2561_INTERRUPT_DISABLE)
+            self._release()
+
+    def clear_interrupt(self):
+        """Clears a pending interrupt, releasing the INT pin."""
+        with self._bus_lock:
+            self._device.writeRaw8(TSL2561_COMMAND_BIT | TSL2561_CLEAR_BIT | TSL2561_REGISTER_INTERRUPT)
+
+    def _threshold(self, register):
+        return self._shadow[register] | (self._shadow[register + 1] << 8)
+
+    def wait_for_threshold(self, pin, callback=None, gpio=None):
+        """Blocks until the light leaves the threshold window and returns the
+        (broadband, ir) sample that left it, calling callback with the same
+        values first if given.
+
+        pin is the GPIO wired to the active low INT output of the sensor and
+        gpio an Adafruit_GPIO style object with setup() and wait_for_edge(),
+        by default the platform GPIO.  Thresholds must have been set with
+        set_thresholds() and interrupts enabled with enable_interrupt().  The
+        sensor is kept integrating while waiting.
+        """
+        if TSL2561_REGISTER_THRESHHOLDL_LOW not in self._shadow or TSL2561_REGISTER_THRESHHOLDH_LOW not in self._shadow:
+            raise RuntimeError('Thresholds are not set. Call set_thresholds() first')
+        low = self._threshold(TSL2561_REGISTER_THRESHHOLDL_LOW)
+        high = self._threshold(TSL2561_REGISTER_THRESHHOLDH_LOW)
+
+        if gpio is None:
+            import Adafruit_GPIO.GPIO as GPIO
+            gpio = GPIO.get_platform_gpio()
+        gpio.setup(pin, _GPIO_IN, pull_up_down=_GPIO_PUD_UP)
+
+        started = not self._continuous
+        self.start()
+        try:
+            while True:
+                self.clear_interrupt()
+                gpio.wait_for_edge(pin, _GPIO_FALLING)
+                with self._bus_lock:
+                    broadband, ir = self._read_counts()
+                    config = self._gain | self._integration_time
+                self._feed_sinks(broadband, ir, config)
+                # Ignore spurious edges and samples back inside the window.
+                if broadband < low or broadband > high:
+                    break
+        finally:
+            self.clear_interrupt()
+            if started:
+                self.stop()
+
+        if callback is not None:
+            callback(broadband, ir)
+        return broadband, ir
 
     # def read_lux_2(self):
     #
@@ -189,141 +840,320 @@ class TSL2561(object):
     #
     #     return lux
 
-    def read_lux(self):
-        LUX_SCALE = 14
-        RATIO_SCALE = 9
-        CH_SCALE = 10
-        CHSCALE_TINT0 = 0x7517
-        CHSCALE_TINT1 = 0x0fe7
-
-        K1T = 0x0040
-        B1T = 0x01f2
-        M1T = 0x01be
-        K2T = 0x0080
-        B2T = 0x0214
-        M2T = 0x02d1
-        K3T = 0x00c0
-        B3T = 0x023f
-        M3T = 0x037b
-        K4T = 0x0100
-        B4T = 0x0270
-        M4T = 0x03fe
-        K5T = 0x0138
-        B5T = 0x016f
-        M5T = 0x01fc
-        K6T = 0x019a
-        B6T = 0x00d2
-        M6T = 0x00fb
-        K7T = 0x029a
-        B7T = 0x0018
-        M7T = 0x0012
-        K8T = 0x029a
-        B8T = 0x0000
-        M8T = 0x0000
-
-        K1C = 0x0043
-        B1C = 0x0204
-        M1C = 0x01ad
-        K2C = 0x0085
-        B2C = 0x0228
-        M2C = 0x02c1
-        K3C = 0x00c8
-        B3C = 0x0253
-        M3C = 0x0363
-        K4C = 0x010a
-        B4C = 0x0282
-        M4C = 0x03df
-        K5C = 0x014d
-        B5C = 0x0177
-        M5C = 0x01dd
-        K6C = 0x019a
-        B6C = 0x0101
-        M6C = 0x0127
-        K7C = 0x029a
-        B7C = 0x0037
-        M7C = 0x002b
-        K8C = 0x029a
-        B8C = 0x0000
-        M8C = 0x0000
-
-        chScale = 1 << CH_SCALE
-        ratio1 = 0
-        b = 0
-        m = 0
-
-        if self._integration_time == 13:
-                chScale = CHSCALE_TINT0
-        elif self._integration_time == 101:
-                chScale = CHSCALE_TINT1
-
-        if self._gain != 16:
-            chScale <<= 4
+    def read_raw_luminosity_manual(self, duration):
+        """Integrates for about duration seconds under host control and returns
+        (broadband, ir, exposure), exposure being the measured length of the
+        integration in seconds.  Manual reads are not fed to sinks.  The
+        sensor is returned to its configured settings and power state if a
+        transaction fails.
 
-        ch0, ch1 = self.read_raw_luminosity()
+        The start and stop times are taken halfway through the Timing Register
+        writes starting and stopping the integration.
+        """
+        if self._continuous:
+            raise RuntimeError('Manual integration is not available in continuous mode. Call stop() first')
+        if duration <= 0:
+            raise ValueError('Unexpected duration {0}. Set to a positive number of seconds'.format(duration))
 
-        channel0 = (ch0 * chScale) >> CH_SCALE
-        channel1 = (ch1 * chScale) >> CH_SCALE
-
-        if channel0 != 0:
-            ratio1 = (channel1 << (RATIO_SCALE+1)) / channel0
-
-        ratio = (ratio1 + 1) >> 1
-
-        if self._package & 0x10:
-            if (ratio >= 0) and (ratio <= K1C):
-                b = B1C
-                m = M1C
-            elif ratio <= K2C:
-                b = B2C
-                m = M2C
-            elif ratio <= K3C:
-                b = B3C
-                m = M3C
-            elif ratio <= K4C:
-                b = B4C
-                m = M4C
-            elif ratio <= K5C:
-                b = B5C
-                m = M5C
-            elif ratio <= K6C:
-                b = B6C
-                m = M6C
-            elif ratio <= K7C:
-                b = B7C
-                m = M7C
-        else:
-            if (ratio >= 0) and (ratio <= K1T):
-                b = B1T
-                m = M1T
-            elif ratio <= K2T:
-                b = B2T
-                m = M2T
-            elif ratio <= K3T:
-                b = B3T
-                m = M3T
-            elif ratio <= K4T:
-                b = B4T
-                m = M4T
-            elif ratio <= K5T:
-                b = B5T
-                m = M5T
-            elif ratio <= K6T:
-                b = B6T
-                m = M6T
-            elif ratio <= K7T:
-                b = B7T
-                m = M7T
-            elif ratio > K8T:
-                b = B8T
-                m = M8T
-
-        temp = (channel0 * b) - (channel1 * m)
-
-        if temp < 0:
-                temp = 0
-
-        temp += (1 << (LUX_SCALE-1))
-
-        lux = temp >> LUX_SCALE
+        with self._bus_lock:
+            manual = self._gain | TSL2561_INTEGRATIONTIME_MANUAL
+            done = False
+            try:
+                self._enable()
+                self._write8(TSL2561_REGISTER_TIMING, manual)
+
+                before = self._clock.monotonic()
+                self._write8(TSL2561_REGISTER_TIMING, manual | TSL2561_MANUAL_BIT)
+                started = (before + self._clock.monotonic()) / 2
+                self._sleep(duration)
+                before = self._clock.monotonic()
+                self._write8(TSL2561_REGISTER_TIMING, manual)
+                stopped = (before + self._clock.monotonic()) / 2
+
+                broadband, ir = self._read_counts()
+
+                self._write8(TSL2561_REGISTER_TIMING, self._gain | self._integration_time)
+                self._release()
+                done = True
+            finally:
+                # The configured settings and power state are restored, see
+                # _acquire().
+                if not done:
+                    self._recover()
+
+        return broadband, ir, stopped - started
+
+    def read_lux_manual(self, duration):
+        """Integrates for about duration seconds under host control and returns
+        the illuminance in lux, scaled by the measured exposure."""
+        broadband, ir, exposure = self.read_raw_luminosity_manual(duration)
+        return self.calculate_lux(broadband, ir, exposure)
 
+    def calculate_lux(self, broadband, ir, exposure=None):
+        """Converts raw counts read with the current gain and integration time,
+        or with a manual integration of exposure seconds, to lux without
+        touching the bus."""
+        if self._instrumentation is None:
+            return compute_lux(broadband, ir, self._integration_time, self._gain, self._package, exposure)
+        start = _monotonic()
+        lux = compute_lux(broadband, ir, self._integration_time, self._gain, self._package, exposure)
+        self._instrumentation.record('conversion', _monotonic() - start)
         return lux
+
+    def read_lux(self):
+        """Reads the sensor and returns the illuminance in lux."""
+        ch0, ch1 = self.read_raw_luminosity()
+        return self.calculate_lux(ch0, ch1)
+
+    def _deadline_integration_time(self, remaining):
+        """Returns the configured integration time, or the longest shorter
+        one when it cannot complete within remaining seconds, or None when
+        none can."""
+        for integration_time in reversed(_INTEGRATION_TIMES[:_INTEGRATION_TIMES.index(self._integration_time) + 1]):
+            if _INTEGRATION_DELAYS[integration_time]/1000.0 + _DEADLINE_MARGIN <= remaining:
+                return integration_time
+        return None
+
+    def _read_before(self, end):
+        """Reads both channels, finishing by monotonic time end.  Returns
+        (broadband, ir, integration_time)."""
+        remaining = end - self._clock.monotonic()
+        if self._continuous:
+            # Switching integration time would restart the running cycle, so
+            # only the wait for the newest one is checked.
+            completed, wait = self._next_cycle(1)
+            if wait + _DEADLINE_MARGIN > remaining:
+                raise TSL2561DeadlineError('No integration cycle completes within {0:0.3f} s'.format(remaining))
+            self._last_cycle = self._wait_for_cycle(1)
+            broadband, ir = self._read_counts()
+            return broadband, ir, self._integration_time
+
+        integration_time = self._deadline_integration_time(remaining)
+        if integration_time is None:
+            raise TSL2561DeadlineError('No integration time completes within {0:0.3f} s'.format(remaining))
+        broadband, ir = self._acquire(integration_time)
+        return broadband, ir, integration_time
+
+    def read(self, deadline=None, retries=2):
+        """Reads the sensor once and returns a TSL2561Reading, from which lux
+        and other derived values are computed without further bus access.
+
+        With deadline, the reading is completed within deadline seconds or
+        TSL2561DeadlineError is raised.  When the configured integration time
+        is too long to meet it, a shorter one is used for this reading only;
+        the reading carries the integration time it was taken with.
+
+        A read failing with an I2C error is retried up to retries times while
+        the deadline allows.  The sensor is returned to its configured power
+        state and settings after a failure.  When instrumented, read
+        latencies go to the 'reading' histogram, retries to the retries counter
+        and missed deadlines to the 'deadline' error counter.
+        """
+        start = self._clock.monotonic()
+        end = None if deadline is None else start + deadline
+        attempt = 0
+        while True:
+            try:
+                # Settings are taken along with the counts, as another
+                # thread may reconfigure the sensor once the bus is released.
+                if end is None:
+                    flight = self._join_flight()
+                    broadband, ir = flight.result
+                    gain, integration_time = flight.settings
+                else:
+                    with self._bus_lock:
+                        broadband, ir, integration_time = self._read_before(end)
+                        gain = self._gain
+                    self._feed_sinks(broadband, ir, gain | integration_time)
+                break
+            except TSL2561DeadlineError:
+                if self._instrumentation is not None:
+                    self._instrumentation.record_error('deadline', None, self._clock.monotonic() - start)
+                raise
+            except (IOError, OSError) as error:
+                if attempt >= retries or (end is not None and self._clock.monotonic() >= end):
+                    raise
+                attempt += 1
+                self._logger.debug('Read failed ({0}), retry {1} of {2}'.format(error, attempt, retries))
+                if self._instrumentation is not None:
+                    self._instrumentation.record_retry(self._clock.monotonic() - start)
+
+        if self._instrumentation is not None:
+            self._instrumentation.record('reading', self._clock.monotonic() - start)
+        return TSL2561Reading(broadband, ir, gain, integration_time, self._package, self._clock.time())
+
+
+class TSL2561Group(object):
+    """Reads several TSL2561 sensors, e.g. one at each of the three I2C
+    addresses of a bus, within a single integration period.  Waits use
+    clock, by default the clock of the first sensor."""
+
+    def __init__(self, sensors, clock=None):
+        self._sensors = list(sensors)
+        if clock is None:
+            clock = self._sensors[0]._clock if self._sensors else _Clock.SYSTEM_CLOCK
+        self._clock = clock
+
+    @property
+    def sensors(self):
+        return list(self._sensors)
+
+    def read_raw_luminosity(self):
+        """Reads all sensors and returns a list with one (broadband, ir) tuple
+        per sensor, in group order.
+
+        Sensors are powered on back to back and members with the same
+        integration time are read together once their cycle completes, so
+        the group costs about the longest integration period plus bus time.
+        Sensors in continuous mode are read as usual.
+        """
+        results = [None] * len(self._sensors)
+        configs = [None] * len(self._sensors)
+
+        # Bus locks are taken in a fixed order so that groups sharing sensors
+        # cannot deadlock.
+        locks = sorted(set(sensor._bus_lock for sensor in self._sensors), key=id)
+        for lock in locks:
+            lock.acquire()
+        # Members powered on and not yet powered off again.  If a transaction
+        # fails they are all put back in a known state, see
+        # TSL2561._recover().
+        powered = []
+        try:
+            batches = {}
+            for index, sensor in enumerate(self._sensors):
+                if not sensor._continuous:
+                    powered.append(sensor)
+                    sensor._enable()
+                    batches.setdefault(sensor._integration_delay(), []).append((index, sensor))
+            start = self._clock.monotonic()
+
+            for delay in sorted(batches):
+                remaining = start + delay - self._clock.monotonic()
+                if remaining > 0:
+                    self._clock.sleep(remaining)
+                for index, sensor in batches[delay]:
+                    results[index] = sensor._read_counts()
+                    configs[index] = sensor._gain | sensor._integration_time
+                    sensor._disable()
+                    powered.remove(sensor)
+        finally:
+            for sensor in powered:
+                sensor._recover()
+            for lock in reversed(locks):
+                lock.release()
+
+        for index, sensor in enumerate(self._sensors):
+            if results[index] is None:
+                results[index] = sensor.read_raw_luminosity()
+            else:
+                sensor._feed_sinks(results[index][0], results[index][1], configs[index])
+
+        return results
+
+    def read_lux(self):
+        """Reads all sensors and returns a list of lux values in group order."""
+        return [sensor.calculate_lux(ch0, ch1) for sensor, (ch0, ch1) in zip(self._sensors, self.read_raw_luminosity())]
+
+
+class TSL2561AutoRange(object):
+    """Picks gain and integration time of a TSL2561 for each reading.
+
+    Settings are ordered from the fastest and least sensitive to the slowest
+    and most sensitive; settings slower than another one with more
+    sensitivity are left out.  A clipped reading steps one setting down and
+    reads again, a reading below min_counts steps up to the first setting
+    expected to reach it, without going to a setting expected to clip, and
+    reads again.  When a faster setting is expected to give at least twice
+    min_counts it is used from the next reading on, which keeps the
+    controller from oscillating at a boundary.  A read makes at most one
+    pass per setting.
+
+    min_counts must stay below the clipping level of the fastest setting
+    divided by the 16x gain step, so that a reading just below it can
+    always step up without clipping.
+    """
+
+    SETTINGS = (
+        (TSL2561_GAIN_1x,  TSL2561_INTEGRATIONTIME_13MS),
+        (TSL2561_GAIN_16x, TSL2561_INTEGRATIONTIME_13MS),
+        (TSL2561_GAIN_16x, TSL2561_INTEGRATIONTIME_101MS),
+        (TSL2561_GAIN_16x, TSL2561_INTEGRATIONTIME_402MS),
+    )
+
+    def __init__(self, sensor, min_counts=256):
+        if not 0 < min_counts < TSL2561_CLIPPING_13MS // 16:
+            raise ValueError('Unexpected min_counts value {0}. Set to a value between 1 and {1}'.format(min_counts, TSL2561_CLIPPING_13MS // 16 - 1))
+        self._sensor = sensor
+        self._min_counts = min_counts
+        self._index = len(self.SETTINGS) - 1
+        self._apply()
+
+    def _apply(self):
+        gain, itime = self.SETTINGS[self._index]
+        self._sensor.configure(gain=gain, integration_time=itime)
+
+    def _scale(self, index):
+        gain, itime = self.SETTINGS[index]
+        return _CHANNEL_SCALES[itime, gain]
+
+    def _expected(self, counts, index):
+        """Returns the counts expected at setting index for counts read at
+        the current setting."""
+        return counts * self._scale(self._index) // self._scale(index)
+
+    def _clipped(self, broadband, ir):
+        clipping = _CLIPPING[self.SETTINGS[self._index][1]]
+        return broadband >= clipping or ir >= clipping
+
+    def _would_clip(self, broadband, ir, index):
+        """Returns True if counts read at the current setting are expected to
+        clip at setting index."""
+        return self._expected(max(broadband, ir), index) >= _CLIPPING[self.SETTINGS[index][1]]
+
+    def read_raw_luminosity(self):
+        """Reads the sensor, adjusting the settings as needed, and returns
+        (broadband, ir, gain, integration_time) with the settings the counts
+        were read with.  Counts may still be clipped at the least sensitive
+        setting, below min_counts at the most sensitive one or below
+        min_counts when more sensitive settings would clip."""
+        for attempt in range(len(self.SETTINGS)):
+            broadband, ir = self._sensor.read_raw_luminosity()
+            gain, itime = self.SETTINGS[self._index]
+
+            if self._clipped(broadband, ir):
+                if self._index == 0:
+                    break
+                self._index -= 1
+            elif broadband < self._min_counts:
+                index = self._index
+                while index < len(self.SETTINGS) - 1 and not self._would_clip(broadband, ir, index + 1):
+                    index += 1
+                    if self._expected(broadband, index) >= self._min_counts:
+                        break
+                if index == self._index:
+                    break
+                self._index = index
+            else:
+                index = 0
+                while index < self._index and self._expected(broadband, index) < 2 * self._min_counts:
+                    index += 1
+                if index != self._index:
+                    self._index = index
+                    self._apply()
+                break
+            self._apply()
+
+        return broadband, ir, gain, itime
+
+    def read_lux(self):
+        """Reads the sensor, adjusting the settings as needed, and returns
+        (lux, gain, integration_time)."""
+        broadband, ir, gain, itime = self.read_raw_luminosity()
+        return compute_lux(broadband, ir, itime, gain, self._sensor._package), gain, itime
+
+    def read(self):
+        """Reads the sensor, adjusting the settings as needed, and returns a
+        TSL2561Reading carrying the settings used."""
+        broadband, ir, gain, itime = self.read_raw_luminosity()
+        return TSL2561Reading(broadband, ir, gain, itime, self._sensor._package, self._sensor._clock.time())
@@ -0,0 +1,4 @@
+# Copyright (c) 2015 Massimo Gaggero
+# Author: Massimo Gaggero
+# Makes pytest put the repository root on sys.path, so that the tests
+# import the Adafruit_TSL2561 package of the checkout with a plain pytest.
@@ -0,0 +1,375 @@
+#!/usr/bin/python
+# Copyright (c) 2015 Massimo Gaggero
+# Author: Massimo Gaggero
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+# Runs the library benchmarks.  Pass benchmark names on the command line to
+# run a subset, e.g.:
+#
+#   python benchmark.py lux_array
+from __future__ import print_function
+
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+
+import Adafruit_TSL2561.TSL2561 as TSL2561
+import Adafruit_TSL2561.Clock as Clock
+import Adafruit_TSL2561.Daemon as Daemon
+import Adafruit_TSL2561.Filters as Filters
+import Adafruit_TSL2561.Fleet as Fleet
+import Adafruit_TSL2561.Scheduler as Scheduler
+import Adafruit_TSL2561.Simulator as Simulator
+
+CONFIGURATIONS = [
+    ('1x/13ms',   TSL2561.TSL2561_GAIN_1x,  TSL2561.TSL2561_INTEGRATIONTIME_13MS),
+    ('16x/13ms',  TSL2561.TSL2561_GAIN_16x, TSL2561.TSL2561_INTEGRATIONTIME_13MS),
+    ('1x/101ms',  TSL2561.TSL2561_GAIN_1x,  TSL2561.TSL2561_INTEGRATIONTIME_101MS),
+    ('16x/101ms', TSL2561.TSL2561_GAIN_16x, TSL2561.TSL2561_INTEGRATIONTIME_101MS),
+    ('1x/402ms',  TSL2561.TSL2561_GAIN_1x,  TSL2561.TSL2561_INTEGRATIONTIME_402MS),
+    ('16x/402ms', TSL2561.TSL2561_GAIN_16x, TSL2561.TSL2561_INTEGRATIONTIME_402MS),
+]
+
+# CPU time of this process, to tell sleeping apart from working.
+_cpu_time = getattr(time, 'process_time', time.clock if hasattr(time, 'clock') else time.time)
+
+
+def simulated_sensor(**kwargs):
+    """Returns a TSL2561 on a simulated bus and its simulated device."""
+    i2c = Simulator.SimulatedI2C(**kwargs)
+    sensor = TSL2561.TSL2561(i2c=i2c)
+    return sensor, i2c.devices[TSL2561.TSL2561_FLOAT_I2CADDR]
+
+
+def bench_lux_array(samples=10000000):
+    """Lux conversion throughput of compute_lux_array() against compute_lux()."""
+    try:
+        import numpy as np
+    except ImportError:
+        print('lux_array: skipped, NumPy is not installed')
+        return
+
+    rng = np.random.RandomState(0)
+    ch0 = rng.randint(0, 65536, samples).astype(np.uint16)
+    ch1 = (ch0 * rng.random_sample(samples)).astype(np.uint16)
+
+    start = time.time()
+    TSL2561.compute_lux_array(ch0, ch1, TSL2561.TSL2561_INTEGRATIONTIME_402MS, TSL2561.TSL2561_GAIN_1x, TSL2561.TSL2561_PACKAGE_T)
+    elapsed = time.time() - start
+    print('lux_array: {0:d} samples in {1:0.3f} s, {2:0.1f} Msamples/s'.format(samples, elapsed, samples / elapsed / 1e6))
+
+    scalar = min(samples, 100000)
+    pairs = list(zip(ch0[:scalar].tolist(), ch1[:scalar].tolist()))
+    start = time.time()
+    for c0, c1 in pairs:
+        TSL2561.compute_lux(c0, c1)
+    elapsed = time.time() - start
+    print('lux_scalar: {0:d} samples in {1:0.3f} s, {2:0.3f} Msamples/s'.format(scalar, elapsed, scalar / elapsed / 1e6))
+
+
+def _report(name, samples, wall, cpu, device):
+    print('{0:<28s} {1:8.1f} samples/s {2:5.1f} transactions/sample  sleep {3:6.3f} s  bus {4:6.3f} s'.format(
+        name, samples / wall, float(device.transactions) / samples, wall - cpu, device.bus_time))
+
+
+def bench_acquisition(duration=1.0):
+    """Samples/s, bus transactions per sample, sleep and bus time of one-shot
+    and continuous reads for each configuration, on a simulated sensor."""
+    for label, gain, itime in CONFIGURATIONS:
+        sensor, device = simulated_sensor()
+        sensor.configure(gain=gain, integration_time=itime)
+
+        device.reset_stats()
+        samples = 0
+        start, cpu = time.time(), _cpu_time()
+        while time.time() - start < duration:
+            sensor.read_raw_luminosity()
+            samples += 1
+        _report('one-shot ' + label, samples, time.time() - start, _cpu_time() - cpu, device)
+
+        device.reset_stats()
+        samples = 0
+        start, cpu = time.time(), _cpu_time()
+        stream = sensor.stream()
+        for sample in stream:
+            samples += 1
+            if time.time() - start >= duration:
+                break
+        stream.close()
+        _report('continuous ' + label, samples, time.time() - start, _cpu_time() - cpu, device)
+
+
+def bench_conversion(samples=100000):
+    """Cost of the lux conversion done by read_lux() for each configuration."""
+    sensor, device = simulated_sensor()
+    for label, gain, itime in CONFIGURATIONS:
+        sensor.configure(gain=gain, integration_time=itime)
+        start = time.time()
+        for i in range(samples):
+            sensor.calculate_lux(1000 + i % 4096, 300 + i % 1024)
+        elapsed = time.time() - start
+        print('conversion {0:<17s} {1:8.3f} us/sample'.format(label, elapsed / samples * 1e6))
+
+
+def bench_startup(sensors=30):
+    """Construction time of eager and lazy sensors, on simulated buses whose
+    transactions take their modeled wire time."""
+    for lazy in (False, True):
+        buses = [Simulator.SimulatedI2C(realtime_bus=True) for i in range(sensors)]
+        start = time.time()
+        for i2c in buses:
+            TSL2561.TSL2561(i2c=i2c, lazy=lazy)
+        elapsed = time.time() - start
+        print('startup {0:<6s} {1:d} sensors in {2:0.4f} s, {3:0.1f} us/sensor'.format(
+            'lazy' if lazy else 'eager', sensors, elapsed, elapsed / sensors * 1e6))
+
+
+def bench_filters(samples=200000):
+    """Per-sample overhead of each filter stage over an in-memory stream."""
+    sensor, device = simulated_sensor()
+    data = [(1000 + (i * 7919) % 500, 300 + (i * 104729) % 100) for i in range(samples)]
+    stages = [
+        ('none', ()),
+        ('median(5)', (Filters.median(5),)),
+        ('ema(0.2)', (Filters.ema(0.2),)),
+        ('boxcar(8)', (Filters.boxcar(8),)),
+        ('downsample(4)', (Filters.downsample(4),)),
+        ('deadband(50)', (Filters.deadband(50),)),
+        ('to_lux', (Filters.to_lux(sensor),)),
+        ('median+ema+to_lux', (Filters.median(5), Filters.ema(0.2), Filters.to_lux(sensor))),
+    ]
+    baseline = None
+    for label, chain in stages:
+        start = time.time()
+        for sample in Filters.pipeline(iter(data), *chain):
+            pass
+        elapsed = (time.time() - start) / samples * 1e6
+        if baseline is None:
+            baseline = elapsed
+        print('filter {0:<20s} {1:6.3f} us/sample'.format(label, elapsed - baseline))
+
+
+def simulated_fleet_sensor(busnum, address):
+    """Fleet sensor factory building 13 ms sensors on simulated buses with
+    real time transactions."""
+    sensor = TSL2561.TSL2561(address, i2c=Simulator.SimulatedI2C(realtime_bus=True))
+    sensor.set_integration_time(TSL2561.TSL2561_INTEGRATIONTIME_13MS)
+    return sensor
+
+
+def bench_fleet(duration=2.0):
+    """Aggregate samples/s of a Fleet as the number of buses grows, three
+    sensors per bus."""
+    addresses = [TSL2561.TSL2561_GND_I2CADDR, TSL2561.TSL2561_FLOAT_I2CADDR, TSL2561.TSL2561_VDD_I2CADDR]
+    for count in (1, 2, 4):
+        fleet = Fleet.Fleet(dict((busnum, addresses) for busnum in range(count)), factory=simulated_fleet_sensor)
+        samples = 0
+        with fleet:
+            fleet.read()
+            start = time.time()
+            while time.time() - start < duration:
+                time.sleep(0.05)
+                samples += len(fleet.read())
+        print('fleet {0:d} buses {1:8.1f} samples/s'.format(count, samples / (time.time() - start)))
+
+
+def _reader(read, end, counts, index):
+    reads = 0
+    while time.time() < end:
+        read()
+        reads += 1
+    counts[index] = reads
+
+
+def bench_coalescing(threads=32, duration=2.0):
+    """Reads/s of threads sharing one 13 ms simulated sensor, with each
+    thread integrating in turn and with concurrent reads coalesced."""
+    for label in ('serialized', 'coalesced'):
+        sensor, device = simulated_sensor()
+        sensor.set_integration_time(TSL2561.TSL2561_INTEGRATIONTIME_13MS)
+        if label == 'serialized':
+            def read():
+                with sensor._bus_lock:
+                    sensor._read_raw_luminosity()
+        else:
+            read = sensor.read_raw_luminosity
+
+        device.reset_stats()
+        counts = [0] * threads
+        end = time.time() + duration
+        workers = [threading.Thread(target=_reader, args=(read, end, counts, index)) for index in range(threads)]
+        start = time.time()
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        elapsed = time.time() - start
+        reads = sum(counts)
+        print('coalescing {0:<10s} {1:d} threads {2:8.1f} reads/s {3:6.2f} transactions/read'.format(
+            label, threads, reads / elapsed, float(device.transactions) / reads))
+
+
+def _daemon_client(path, duration, subscribe, counts, index):
+    with Daemon.TSL2561Client(path=path) as client:
+        received = 0
+        if subscribe:
+            readings = client.readings()
+            end = time.time() + duration
+            for reading in readings:
+                received += 1
+                if time.time() >= end:
+                    break
+            readings.close()
+        else:
+            end = time.time() + duration
+            while time.time() < end:
+                client.read()
+                received += 1
+        counts[index] = received
+
+
+def bench_daemon(duration=2.0):
+    """Throughput of a SensorDaemon serving a 13 ms simulated sensor to
+    hundreds of local clients, with one-shot reads and with subscriptions."""
+    directory = tempfile.mkdtemp()
+    try:
+        for subscribe in (False, True):
+            for count in (10, 100, 300):
+                sensor, device = simulated_sensor()
+                sensor.set_integration_time(TSL2561.TSL2561_INTEGRATIONTIME_13MS)
+                daemon = Daemon.SensorDaemon(os.path.join(directory, 'tsl2561.sock'), [sensor])
+                server = threading.Thread(target=daemon.serve_forever)
+                server.start()
+                while not os.path.exists(daemon.path):
+                    time.sleep(0.01)
+
+                counts = [0] * count
+                clients = [threading.Thread(target=_daemon_client, args=(daemon.path, duration, subscribe, counts, index)) for index in range(count)]
+                start = time.time()
+                for client in clients:
+                    client.start()
+                for client in clients:
+                    client.join()
+                elapsed = time.time() - start
+                daemon.shutdown()
+                server.join()
+                print('daemon {0:<9s} {1:3d} clients {2:9.1f} replies/s {3:6d} dropped  sensor transactions {4:d}'.format(
+                    'subscribe' if subscribe else 'read', count, sum(counts) / elapsed, daemon.dropped, device.transactions))
+    finally:
+        shutil.rmtree(directory)
+
+
+# Sampling targets of bench_scheduler: address, rate (Hz), maximum latency (s).
+SCHEDULER_TARGETS = [
+    (TSL2561.TSL2561_GND_I2CADDR,   10.0, 0.05),
+    (TSL2561.TSL2561_FLOAT_I2CADDR, 10.0, 0.05),
+    (TSL2561.TSL2561_VDD_I2CADDR,   0.1,  1.0),
+]
+
+
+def bench_scheduler(duration=5.0):
+    """Deadline misses and bus utilization of a BusScheduler sampling two
+    10 Hz sensors and a 0.1 Hz one on a real time simulated bus, against a
+    loop reading each sensor in turn when due."""
+    i2c = Simulator.SimulatedI2C(realtime_bus=True)
+    sensors = [TSL2561.TSL2561(address, i2c=i2c) for address, rate, latency in SCHEDULER_TARGETS]
+
+    scheduler = Scheduler.BusScheduler()
+    for sensor, (address, rate, latency) in zip(sensors, SCHEDULER_TARGETS):
+        scheduler.add(sensor, rate, latency)
+    scheduler.run(duration)
+    for scheduled in scheduler.sensors:
+        print('scheduler 0x{0:02X} {1:5.1f} Hz {2:3d} ms  {3:4d} samples {4:3d} misses {5:3d} skipped  worst latency {6:6.1f} ms'.format(
+            scheduled.sensor._address, 1.0 / scheduled.period, TSL2561._INTEGRATION_DELAYS[scheduled.integration_time],
+            scheduled.samples, scheduled.misses, scheduled.skipped, scheduled.worst_latency * 1000))
+    print('scheduler bus utilization {0:0.2%}'.format(scheduler.utilization()))
+
+    samples = [0] * len(sensors)
+    misses = [0] * len(sensors)
+    start = time.time()
+    due = [start] * len(sensors)
+    while time.time() - start < duration:
+        for index, (sensor, (address, rate, latency)) in enumerate(zip(sensors, SCHEDULER_TARGETS)):
+            if time.time() < due[index]:
+                continue
+            sensor.read_raw_luminosity()
+            samples[index] += 1
+            if time.time() - due[index] > latency:
+                misses[index] += 1
+            due[index] = max(due[index] + 1.0 / rate, time.time())
+        time.sleep(0.001)
+    for index, (address, rate, latency) in enumerate(SCHEDULER_TARGETS):
+        print('loop      0x{0:02X} {1:5.1f} Hz         {2:4d} samples {3:3d} misses'.format(address, rate, samples[index], misses[index]))
+
+
+def bench_virtual(hours=24.0):
+    """Wall time of long simulations on a virtual clock: a day of continuous
+    402 ms sampling under a daylight scene, and an hour of a BusScheduler
+    running the SCHEDULER_TARGETS on a real time simulated bus."""
+    clock = Clock.VirtualClock()
+    i2c = Simulator.SimulatedI2C(scene=Simulator.daylight(40000, 12000), clock=clock)
+    sensor = TSL2561.TSL2561(i2c=i2c, clock=clock)
+    end = clock.monotonic() + hours * 3600
+    samples = 0
+    start = time.time()
+    stream = sensor.stream()
+    for sample in stream:
+        samples += 1
+        if clock.monotonic() >= end:
+            break
+    stream.close()
+    elapsed = time.time() - start
+    print('virtual stream    {0:5.1f} h simulated in {1:6.2f} s, {2:d} samples, {3:8.0f}x real time'.format(
+        hours, elapsed, samples, hours * 3600 / elapsed))
+
+    clock = Clock.VirtualClock()
+    i2c = Simulator.SimulatedI2C(realtime_bus=True, clock=clock)
+    scheduler = Scheduler.BusScheduler()
+    for address, rate, latency in SCHEDULER_TARGETS:
+        scheduler.add(TSL2561.TSL2561(address, i2c=i2c, clock=clock), rate, latency)
+    start = time.time()
+    scheduler.run(3600.0)
+    elapsed = time.time() - start
+    print('virtual scheduler   1.0 h simulated in {0:6.2f} s, {1:d} samples, {2:d} misses, bus utilization {3:0.2%}, {4:8.0f}x real time'.format(
+        elapsed, sum(scheduled.samples for scheduled in scheduler.sensors), sum(scheduled.misses for scheduled in scheduler.sensors),
+        scheduler.utilization(), 3600 / elapsed))
+
+
+BENCHMARKS = {
+    'acquisition': bench_acquisition,
+    'coalescing': bench_coalescing,
+    'conversion': bench_conversion,
+    'daemon': bench_daemon,
+    'filters': bench_filters,
+    'fleet': bench_fleet,
+    'lux_array': bench_lux_array,
+    'scheduler': bench_scheduler,
+    'startup': bench_startup,
+    'virtual': bench_virtual,
+}
+
+
+if __name__ == '__main__':
+    names = sys.argv[1:] or sorted(BENCHMARKS)
+    for name in names:
+        BENCHMARKS[name]()
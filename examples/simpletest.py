@@ -39,8 +39,9 @@ sensor = TSL2561.TSL2561()
 # Optionally you can override the bus number:
 # sensor = TSL2561.TSL2561(busnum=2)
 
-broadband, infrared = sensor.read_raw_luminosity()
+# A single read answers every question about the sample.
+reading = sensor.read()
 
-print 'Visible light (raw) = {:d}'.format(broadband)
-print 'Infrared light (raw) = {:d}'.format(infrared)
-print 'Computed Light = {0:0.2f} Lux'.format(sensor.read_lux())
+print 'Visible light (raw) = {:d}'.format(reading.broadband)
+print 'Infrared light (raw) = {:d}'.format(reading.ir)
+print 'Computed Light = {0:0.2f} Lux'.format(reading.lux)
@@ -12,5 +12,11 @@ setup(
     url                   = 'https://github.com/mgaggero/Adafruit_Python_TSL2561',
     dependency_links      = ['https://github.com/adafruit/Adafruit_Python_GPIO/tarball/master#egg=Adafruit-GPIO-0.6.5'],
     install_requires      = ['Adafruit-GPIO>=0.6.5'],
-    packages              = find_packages()
+    packages              = find_packages(),
+    entry_points          = {
+        'console_scripts': [
+            'tsl2561-convert = Adafruit_TSL2561.Convert:main',
+            'tsl2561-daemon = Adafruit_TSL2561.Daemon:main',
+        ],
+    },
 )
\ No newline at end of file
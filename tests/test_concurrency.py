@@ -0,0 +1,222 @@
+# Copyright (c) 2015 Massimo Gaggero
+# Author: Massimo Gaggero
+import threading
+import time
+
+from Adafruit_TSL2561 import Clock
+from Adafruit_TSL2561 import Simulator
+from Adafruit_TSL2561 import TSL2561
+
+
+class OverlapDetectingDevice(object):
+    """Wraps a device, counting transactions started while another one was
+    still running.  Each transaction is stretched to widen the window."""
+
+    def __init__(self, device):
+        self.device = device
+        self.overlaps = 0
+        self.fail = False
+        self._busy = threading.Lock()
+
+    def __getattr__(self, name):
+        operation = getattr(self.device, name)
+
+        def transaction(*args):
+            if not self._busy.acquire(False):
+                self.overlaps += 1
+                return operation(*args)
+            try:
+                time.sleep(0.0002)
+                if self.fail and name == 'readU16LE':
+                    raise IOError(121, 'Remote I/O error')
+                return operation(*args)
+            finally:
+                self._busy.release()
+        return transaction
+
+
+def make_sensor(address=TSL2561.TSL2561_FLOAT_I2CADDR, i2c=None, scene=None, clock=None):
+    if i2c is None:
+        i2c = Simulator.SimulatedI2C(scene=scene, clock=clock)
+    sensor = TSL2561.TSL2561(address, i2c=i2c, clock=clock)
+    sensor.set_integration_time(TSL2561.TSL2561_INTEGRATIONTIME_13MS)
+    device = i2c.devices[address]
+    sensor._device = OverlapDetectingDevice(sensor._device)
+    return sensor, device
+
+
+def run_threads(target, count):
+    threads = [threading.Thread(target=target) for i in range(count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+
+def test_concurrent_reads_do_not_interleave():
+    sensor, device = make_sensor(scene=Simulator.steps([(1000, 100), (2000, 200)], 0.02))
+    results = []
+
+    def read():
+        for i in range(20):
+            results.append(sensor.read_raw_luminosity())
+
+    def reconfigure():
+        for i in range(20):
+            sensor.configure(integration_time=(TSL2561.TSL2561_INTEGRATIONTIME_13MS, TSL2561.TSL2561_INTEGRATIONTIME_101MS)[i % 2])
+        sensor.configure(integration_time=TSL2561.TSL2561_INTEGRATIONTIME_13MS)
+
+    threads = [threading.Thread(target=read) for i in range(16)] + [threading.Thread(target=reconfigure)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert sensor._device.overlaps == 0
+    assert len(results) == 16 * 20
+    assert not device.powered
+
+
+def test_concurrent_reads_are_coalesced():
+    sensor, device = make_sensor()
+    barrier = threading.Barrier(8)
+    results = []
+
+    def read():
+        barrier.wait()
+        results.append(sensor.read_raw_luminosity())
+
+    device.reset_stats()
+    run_threads(read, 8)
+
+    assert len(set(results)) == 1
+    # One enable, two channel reads and one disable per integration.
+    assert device.transactions < 8 * 4
+
+
+def test_error_reaches_every_waiting_thread():
+    sensor, device = make_sensor()
+    sensor._device.fail = True
+    barrier = threading.Barrier(8)
+    errors = []
+
+    def read():
+        barrier.wait()
+        try:
+            sensor.read_raw_luminosity()
+        except IOError as error:
+            errors.append(error)
+
+    run_threads(read, 8)
+
+    assert len(errors) == 8
+    assert not device.powered
+
+
+def test_manual_read_is_not_interleaved():
+    # Manual counts follow the measured exposure; a virtual clock keeps it
+    # free of sleep jitter.  Sleeps of both threads happen under the bus
+    # lock, so they do not add up.
+    sensor, device = make_sensor(scene=Simulator.constant(1000, 100), clock=Clock.VirtualClock())
+    alone = sensor.read_raw_luminosity_manual(0.05)[:2]
+    stopping = threading.Event()
+
+    def read():
+        while not stopping.is_set():
+            sensor.read_raw_luminosity()
+
+    reader = threading.Thread(target=read)
+    reader.start()
+    try:
+        shared = [sensor.read_raw_luminosity_manual(0.05)[:2] for i in range(3)]
+    finally:
+        stopping.set()
+        reader.join()
+
+    assert shared == [alone] * 3
+    assert sensor._device.overlaps == 0
+
+
+def test_threshold_and_interrupt_setup_is_not_interleaved():
+    sensor, device = make_sensor()
+    stopping = threading.Event()
+
+    def read():
+        while not stopping.is_set():
+            sensor.read_raw_luminosity()
+
+    reader = threading.Thread(target=read)
+    reader.start()
+    try:
+        for low in range(0, 400, 20):
+            sensor.set_thresholds(low, low + 1000)
+            sensor.enable_interrupt(persistence=low % 16)
+            sensor.clear_interrupt()
+            sensor.disable_interrupt()
+            assert sensor.read_id_register() == device.part_id
+    finally:
+        stopping.set()
+        reader.join()
+
+    assert sensor._device.overlaps == 0
+    assert device._word(TSL2561.TSL2561_REGISTER_THRESHHOLDL_LOW) == 380
+    assert device._word(TSL2561.TSL2561_REGISTER_THRESHHOLDH_LOW) == 1380
+    assert not device.powered
+
+
+def test_group_read_is_not_interleaved():
+    i2c = Simulator.SimulatedI2C()
+    sensors = [make_sensor(address, i2c)[0] for address in (TSL2561.TSL2561_GND_I2CADDR, TSL2561.TSL2561_FLOAT_I2CADDR)]
+    group = TSL2561.TSL2561Group(sensors)
+    stopping = threading.Event()
+
+    def read(sensor):
+        while not stopping.is_set():
+            sensor.read_raw_luminosity()
+
+    readers = [threading.Thread(target=read, args=(sensor,)) for sensor in sensors]
+    for reader in readers:
+        reader.start()
+    try:
+        results = [group.read_raw_luminosity() for i in range(10)]
+    finally:
+        stopping.set()
+        for reader in readers:
+            reader.join()
+
+    assert all(len(result) == 2 for result in results)
+    assert all(sensor._device.overlaps == 0 for sensor in sensors)
+    assert not any(device.powered for device in i2c.devices.values())
+
+
+def test_reading_carries_the_settings_of_its_counts():
+    sensor, device = make_sensor(scene=Simulator.constant(1000, 100))
+    settings = [(TSL2561.TSL2561_GAIN_1x, TSL2561.TSL2561_INTEGRATIONTIME_13MS), (TSL2561.TSL2561_GAIN_16x, TSL2561.TSL2561_INTEGRATIONTIME_101MS)]
+    expected = {}
+    for gain, integration_time in settings:
+        sensor.configure(gain, integration_time)
+        expected[gain, integration_time] = sensor.read_raw_luminosity()
+    stopping = threading.Event()
+
+    class SlowSink(object):
+        # Widens the window between the end of the bus sequence and the
+        # return of the read.
+        def append(self, *args):
+            time.sleep(0.002)
+
+    def reconfigure():
+        i = 0
+        while not stopping.is_set():
+            sensor.configure(*settings[i % 2])
+            i += 1
+
+    sensor.add_sink(SlowSink())
+    reconfigurer = threading.Thread(target=reconfigure)
+    reconfigurer.start()
+    try:
+        readings = [sensor.read() for i in range(50)]
+    finally:
+        stopping.set()
+        reconfigurer.join()
+
+    assert all((reading.broadband, reading.ir) == expected[reading.gain, reading.integration_time] for reading in readings)